@@ -0,0 +1,38 @@
+"""Add hand_status to participations
+
+Revision ID: 3f1c9a7d52e4
+Revises: b6fefa705edf
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.enums import HandStatus
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c9a7d52e4'
+down_revision: Union[str, Sequence[str], None] = 'b6fefa705edf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    hand_status = sa.Enum(*[status.name for status in HandStatus],
+                          name='handstatus')
+    hand_status.create(op.get_bind(), checkfirst=True)
+    op.add_column(
+        'participations',
+        sa.Column('hand_status', hand_status, nullable=False,
+                  server_default=HandStatus.WAITING.name)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('participations', 'hand_status')
+    sa.Enum(*[status.name for status in HandStatus],
+            name='handstatus').drop(op.get_bind())
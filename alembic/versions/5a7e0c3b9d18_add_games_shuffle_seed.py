@@ -0,0 +1,35 @@
+"""Add shuffle seed to games
+
+Revision ID: 5a7e0c3b9d18
+Revises: 8e2d4b61c0a7
+Create Date: 2026-10-18 11:26:53.902716
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a7e0c3b9d18'
+down_revision: Union[str, Sequence[str], None] = '8e2d4b61c0a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('games', sa.Column('shuffle_seed', sa.BigInteger()))
+    op.add_column('games', sa.Column('shuffles', sa.Integer(),
+                                     nullable=False, server_default='0'))
+    # Games created before seeded shuffles cannot be replayed
+    op.execute(
+        "UPDATE games SET shuffle_seed = floor(random() * 9223372036854775807)::bigint")
+    op.alter_column('games', 'shuffle_seed', nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('games', 'shuffles')
+    op.drop_column('games', 'shuffle_seed')
@@ -0,0 +1,33 @@
+"""Add participations history index
+
+Revision ID: 6b93e5d1f4a2
+Revises: d41f7a2c8b36
+Create Date: 2026-10-18 14:58:41.092716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6b93e5d1f4a2'
+down_revision: Union[str, Sequence[str], None] = 'd41f7a2c8b36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Pages of the participations of a user, newest first. Its prefix
+    # covers the lookups on user_id alone.
+    op.create_index('ix_participations_user_id_created_at_id',
+                    'participations', ['user_id', 'created_at', 'id'])
+    op.drop_index('ix_participations_user_id', 'participations')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_participations_user_id',
+                    'participations', ['user_id'])
+    op.drop_index('ix_participations_user_id_created_at_id', 'participations')
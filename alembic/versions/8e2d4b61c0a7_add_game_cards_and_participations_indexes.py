@@ -0,0 +1,41 @@
+"""Add game_cards and participations indexes
+
+Revision ID: 8e2d4b61c0a7
+Revises: 3f1c9a7d52e4
+Create Date: 2026-10-18 10:02:17.544913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e2d4b61c0a7'
+down_revision: Union[str, Sequence[str], None] = '3f1c9a7d52e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Loading the cards of a game, ordered as in the shoe
+    op.create_index('ix_game_cards_game_id_position',
+                    'game_cards', ['game_id', 'position'])
+    # Reading the hand of a participation or of the dealer
+    op.create_index('ix_game_cards_holder_id_location_type',
+                    'game_cards', ['holder_id', 'location_type'])
+    # Loading the seats of a game
+    op.create_index('ix_participations_game_id_position',
+                    'participations', ['game_id', 'position'])
+    # Listing the participations of a user
+    op.create_index('ix_participations_user_id',
+                    'participations', ['user_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_participations_user_id', 'participations')
+    op.drop_index('ix_participations_game_id_position', 'participations')
+    op.drop_index('ix_game_cards_holder_id_location_type', 'game_cards')
+    op.drop_index('ix_game_cards_game_id_position', 'game_cards')
@@ -0,0 +1,35 @@
+"""Add games listing indexes
+
+Revision ID: d41f7a2c8b36
+Revises: 5a7e0c3b9d18
+Create Date: 2026-10-18 14:21:08.317402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41f7a2c8b36'
+down_revision: Union[str, Sequence[str], None] = '5a7e0c3b9d18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Pages of games, newest first, optionally filtered on status or variant
+    op.create_index('ix_games_created_at_id',
+                    'games', ['created_at', 'id'])
+    op.create_index('ix_games_status_created_at_id',
+                    'games', ['status', 'created_at', 'id'])
+    op.create_index('ix_games_variant_created_at_id',
+                    'games', ['variant', 'created_at', 'id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_games_variant_created_at_id', 'games')
+    op.drop_index('ix_games_status_created_at_id', 'games')
+    op.drop_index('ix_games_created_at_id', 'games')
@@ -0,0 +1,42 @@
+"""Create idempotency_keys table
+
+Revision ID: f28c6e9a1b47
+Revises: 6b93e5d1f4a2
+Create Date: 2026-10-18 17:12:36.581904
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f28c6e9a1b47'
+down_revision: Union[str, Sequence[str], None] = '6b93e5d1f4a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('user_id', sa.Uuid(), nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('status_code', sa.Integer(), nullable=False),
+        sa.Column('response', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('user_id', 'key'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE')
+    )
+    # Purge of the expired keys
+    op.create_index('ix_idempotency_keys_created_at',
+                    'idempotency_keys', ['created_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_idempotency_keys_created_at', 'idempotency_keys')
+    op.drop_table('idempotency_keys')
@@ -1,4 +1,5 @@
 """Main entry point for the FastAPI application."""
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
@@ -9,6 +10,11 @@ from app.routers.auth import router as auth_router
 from app.routers.users import router as users_router
 from app.routers.games import router as games_router
 from app.routers.participations import router as participations_router
+from app.routers.simulations import router as simulations_router
+from app.database import AsyncSessionLocal, dispose_engine, init_engine
+from app.idempotency import purge_expired_keys_periodically
+from app.shoe import load_shoe_templates
+from app.simulation import simulation_pool
 from app.logger import logger
 
 
@@ -16,8 +22,15 @@ from app.logger import logger
 async def lifespan(_app: FastAPI):
     """Startup and shutdown events"""
     logger.info("Starting up...")
+    init_engine()
+    async with AsyncSessionLocal() as db:
+        await load_shoe_templates(db)
+    purge_task = asyncio.create_task(purge_expired_keys_periodically())
     yield
     logger.info("Shutting down...")
+    purge_task.cancel()
+    simulation_pool.shutdown()
+    await dispose_engine()
 
 app = FastAPI(lifespan=lifespan)
 app.include_router(health_router)
@@ -25,6 +38,7 @@ app.include_router(auth_router)
 app.include_router(users_router)
 app.include_router(games_router)
 app.include_router(participations_router)
+app.include_router(simulations_router)
 
 app.openapi_schema = get_openapi(
     title="Trump API",
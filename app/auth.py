@@ -1,21 +1,95 @@
 """Authentication backend"""
+import hashlib
+import hmac
+import time
 import uuid
+from collections import OrderedDict
 from typing import Optional
 
-from fastapi import Depends, Request
-from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin
+import jwt
+from fastapi import Depends, Request, Response, status
+from fastapi.responses import JSONResponse
+from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin, exceptions
 from fastapi_users.authentication import (
     AuthenticationBackend,
     BearerTransport,
     JWTStrategy,
+    Strategy,
 )
 from fastapi_users.db import SQLAlchemyUserDatabase
+from fastapi_users.jwt import decode_jwt, generate_jwt
+from fastapi_users.openapi import OpenAPIResponseType
+from sqlalchemy import inspect
 
 from app.database import get_user_db
 from app.models import User
+from app.schemas import TokenRead
 from app.config import settings
 
 
+class PrincipalCache:
+    """Users authenticated by access token, kept until the entry or the token expires
+
+    Entries are snapshots of the user columns, invalidated when the user
+    changes in this process. Other workers see the change when their
+    entry expires, after PRINCIPAL_CACHE_TTL seconds at most.
+    """
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._user_tokens: dict[uuid.UUID, set[str]] = {}
+
+    def get(self, token: str) -> Optional[User]:
+        """Get a copy of the user authenticated by a token"""
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+
+        expires_at, snapshot = entry
+        if expires_at <= time.time():
+            self._remove(token)
+            return None
+
+        self._entries.move_to_end(token)
+        return User(**snapshot)
+
+    def put(self, token: str, user: User, token_expires_at: Optional[float]) -> None:
+        """Cache the user authenticated by a token"""
+        expires_at = time.time() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+
+        snapshot = {attribute.key: getattr(user, attribute.key)
+                    for attribute in inspect(User).column_attrs}
+        self._entries[token] = (expires_at, snapshot)
+        self._entries.move_to_end(token)
+        self._user_tokens.setdefault(user.id, set()).add(token)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, user_id: uuid.UUID) -> None:
+        """Forget every token of a user"""
+        for token in self._user_tokens.pop(user_id, set()):
+            self._entries.pop(token, None)
+
+    def _remove(self, token: str) -> None:
+        _, snapshot = self._entries.pop(token)
+        tokens = self._user_tokens.get(snapshot['id'])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._user_tokens[snapshot['id']]
+
+
+principal_cache = PrincipalCache(
+    ttl=min(settings.PRINCIPAL_CACHE_TTL, settings.TOKEN_LIFETIME),
+    max_entries=settings.PRINCIPAL_CACHE_MAX,
+)
+
+
 class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
     """User manager"""
     reset_password_token_secret = settings.SECRET_KEY
@@ -24,6 +98,11 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
     async def on_after_register(self, user: User, request: Optional[Request] = None):
         print(f"User {user.id} has registered.")
 
+    async def on_after_update(
+        self, user: User, update_dict: dict, request: Optional[Request] = None
+    ):
+        principal_cache.invalidate(user.id)
+
     async def on_after_forgot_password(
         self, user: User, token: str, request: Optional[Request] = None
     ):
@@ -41,15 +120,131 @@ async def get_user_manager(user_db: SQLAlchemyUserDatabase = Depends(get_user_db
     yield UserManager(user_db)
 
 
-bearer_transport = BearerTransport(tokenUrl="auth/login")
+REFRESH_TOKEN_AUDIENCE = ["trump-api:refresh"]
+
+
+class RefreshBearerTransport(BearerTransport):
+    """Bearer transport returning a refresh token along with the access token"""
+
+    def get_tokens_response(self, access_token: str, refresh_token: str) -> Response:
+        """Response of a login, with both tokens"""
+        token_read = TokenRead(access_token=access_token, refresh_token=refresh_token,
+                               token_type="bearer")
+        return JSONResponse(token_read.model_dump())
+
+    @staticmethod
+    def get_openapi_login_responses_success() -> OpenAPIResponseType:
+        return {status.HTTP_200_OK: {"model": TokenRead}}
+
+
+bearer_transport = RefreshBearerTransport(tokenUrl="auth/login")
+
+
+class CachedJWTStrategy(JWTStrategy[User, uuid.UUID]):
+    """JWT strategy reading the users from the principal cache"""
+
+    async def read_token(
+        self, token: Optional[str], user_manager: BaseUserManager[User, uuid.UUID]
+    ) -> Optional[User]:
+        if token is None:
+            return None
+
+        # A cached token has already been verified
+        user = principal_cache.get(token)
+        if user is not None:
+            return user
+
+        try:
+            data = decode_jwt(
+                token, self.decode_key, self.token_audience, algorithms=[self.algorithm]
+            )
+            user_id = data.get("sub")
+            if user_id is None:
+                return None
+        except jwt.PyJWTError:
+            return None
+
+        try:
+            user = await user_manager.get(user_manager.parse_id(user_id))
+        except (exceptions.UserNotExists, exceptions.InvalidID):
+            return None
+
+        principal_cache.put(token, user, data.get("exp"))
+        return user
 
 
 def get_jwt_strategy() -> JWTStrategy:
     """Get JWT strategy"""
-    return JWTStrategy(secret=settings.SECRET_KEY, lifetime_seconds=3600)
+    return CachedJWTStrategy(secret=settings.SECRET_KEY,
+                             lifetime_seconds=settings.TOKEN_LIFETIME)
+
+
+def password_fingerprint(user: User) -> str:
+    """Digest of the password hash of a user, changing with the password"""
+    return hmac.new(settings.SECRET_KEY.encode(), getattr(user, 'hashed_password').encode(),
+                    hashlib.sha256).hexdigest()
+
+
+class RefreshJWTStrategy(JWTStrategy[User, uuid.UUID]):
+    """JWT strategy of refresh tokens, bound to the password they were issued for
+
+    Refresh tokens are not stored, a token stays valid until it expires or
+    the password of its user changes. Logging out does not revoke it.
+    """
+
+    async def read_token(
+        self, token: Optional[str], user_manager: BaseUserManager[User, uuid.UUID]
+    ) -> Optional[User]:
+        if token is None:
+            return None
+
+        try:
+            data = decode_jwt(
+                token, self.decode_key, self.token_audience, algorithms=[self.algorithm]
+            )
+            user_id = data.get("sub")
+            if user_id is None:
+                return None
+        except jwt.PyJWTError:
+            return None
+
+        try:
+            user = await user_manager.get(user_manager.parse_id(user_id))
+        except (exceptions.UserNotExists, exceptions.InvalidID):
+            return None
+
+        if not hmac.compare_digest(str(data.get("pwd", "")), password_fingerprint(user)):
+            return None
+
+        return user
+
+    async def write_token(self, user: User) -> str:
+        data = {"sub": str(user.id), "aud": self.token_audience,
+                "pwd": password_fingerprint(user)}
+        return generate_jwt(
+            data, self.encode_key, self.lifetime_seconds, algorithm=self.algorithm
+        )
+
+
+def get_refresh_strategy() -> JWTStrategy:
+    """Get the JWT strategy of refresh tokens"""
+    return RefreshJWTStrategy(secret=settings.SECRET_KEY,
+                              lifetime_seconds=settings.REFRESH_TOKEN_LIFETIME,
+                              token_audience=REFRESH_TOKEN_AUDIENCE)
+
+
+class RefreshAuthenticationBackend(AuthenticationBackend[User, uuid.UUID]):
+    """Authentication backend logging in with an access and a refresh token"""
+
+    async def login(
+        self, strategy: Strategy[User, uuid.UUID], user: User
+    ) -> Response:
+        access_token = await strategy.write_token(user)
+        refresh_token = await get_refresh_strategy().write_token(user)
+        return bearer_transport.get_tokens_response(access_token, refresh_token)
 
 
-auth_backend = AuthenticationBackend(
+auth_backend = RefreshAuthenticationBackend(
     name="jwt",
     transport=bearer_transport,
     get_strategy=get_jwt_strategy,
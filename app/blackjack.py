@@ -1,145 +1,294 @@
 """Blackjack game logic"""
-import random
-from sqlalchemy import select
+import uuid
+
+from sqlalchemy import insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import Game, Participation, PhysicalCard, GameCard
-from app.enums import GameStatus, ParticipationStatus, CardLocation
+from app.models import Game, GameCard
+from app.engine import GameState, SeatState, game_engine
+from app.cards import CARD_VALUES, HandSummary, HandValue, encode_card
+from app.shoe import DECK_COUNTS, get_shoe_template
+from app.shuffle import shuffle_shoe
+from app.enums import GameStatus, GameVariant, ParticipationStatus, CardLocation, HandStatus
+
+# Share of the shoe dealt before it is reshuffled
+PENETRATION = 0.75
+# The dealer draws until reaching this total
+DEALER_STANDS_ON = 17
+# Naturals are paid 3 to 2
+NATURAL_PAYOUT = (3, 2)
+# A hand stops drawing once its hard total exceeds 21, holding at most 31 points
+MAX_HAND_POINTS = 31
 
 
 async def initialize_decks(game: Game, db: AsyncSession) -> None:
-    """Initialize cards for a game"""
+    """Initialize the shuffled cards of a game in a single INSERT"""
     if getattr(game, 'status') != GameStatus.READY:
         return
 
     # Check if there is any game_card for this game
-    game_cards = await db.scalars(
-        select(GameCard).where(GameCard.game_id == game.id)
+    existing_card = await db.scalar(
+        select(GameCard.id).where(GameCard.game_id == game.id).limit(1)
     )
-    if list(game_cards):
+    if existing_card is not None:
         return
 
-    # Get all physical cards
-    physical_cards = list(await db.scalars(
-        select(PhysicalCard).where(PhysicalCard.deck_number == 1)
-    ))
-
-    # Create game cards
-    for i, physical_card in enumerate(physical_cards):
-        print(i, physical_card.id)
-        game_card = GameCard(
-            suit=physical_card.suit,
-            rank=physical_card.rank,
-            game_id=game.id,
-            physical_card_id=physical_card.id,
-            location_type=CardLocation.DECK,
-            holder_id=None,
-            position=i
-        )
-        db.add(game_card)
+    # Give an id to every card of the variant shoe and shuffle them before they are written
+    template = await get_shoe_template(getattr(game, 'variant'), db)
+    cards = {uuid.uuid4(): card for card in template}
+    codes = {card_id: encode_card(suit, rank)
+             for card_id, (_, suit, rank) in cards.items()}
+    shoe = shuffle_shoe(list(cards), codes, getattr(game, 'shuffle_seed'), 0)
+
+    # Create game cards with one executemany INSERT
+    await db.execute(insert(GameCard), [
+        {
+            'id': card_id,
+            'suit': cards[card_id][1],
+            'rank': cards[card_id][2],
+            'game_id': game.id,
+            'physical_card_id': cards[card_id][0],
+            'location_type': CardLocation.DECK,
+            'holder_id': None,
+            'position': i,
+        }
+        for i, card_id in enumerate(shoe)
+    ])
     await db.commit()
-    await shuffle_deck(game, db)
 
+    # The new game state is fully known, no need to read it back
+    state = GameState(game)
+    state.shoe = shoe
+    state.codes = codes
+    game_engine.register(state)
+
+
+def max_seats(variant: GameVariant) -> int:
+    """Seats of a table whose hands, the dealer's included, can never hold the whole shoe,
+    so that a draw always finds a card in the shoe or the discards"""
+    shoe_points = sum(CARD_VALUES) * DECK_COUNTS[variant]
+    return (shoe_points - 1) // MAX_HAND_POINTS - 1
 
-async def evaluate_game_status(game: Game, db: AsyncSession) -> GameStatus:
-    """Evaluate game status depending on participations"""
 
-    participations = await db.scalars(
-        select(Participation).where(Participation.game_id == game.id))
+def evaluate_game_status(state: GameState) -> GameStatus:
+    """Evaluate game status depending on participations"""
 
     # Game cannot be reopened
-    if getattr(game, 'status') == GameStatus.FINISHED:
+    if state.status == GameStatus.FINISHED:
         return GameStatus.FINISHED
 
     # Close the game when all participants have quit
-    if all(getattr(participation, 'status') == ParticipationStatus.QUIT
-           for participation in participations):
+    if all(seat.status == ParticipationStatus.QUIT
+           for seat in state.seats.values()):
         return GameStatus.FINISHED
 
     # Set the game as playing when all participants have placed a bet
-    active_participations = [
-        participation for participation in participations
-        if getattr(participation, 'status') == ParticipationStatus.PLAYING
+    active_seats = [
+        seat for seat in state.seats.values()
+        if seat.status == ParticipationStatus.PLAYING
     ]
 
-    if all(getattr(participation, 'bet') > 0
-           for participation in active_participations):
+    if all(seat.bet > 0 for seat in active_seats):
         return GameStatus.PLAYING
 
     # Otherwise, the game is ready
     return GameStatus.READY
 
 
-async def shuffle_deck(game: Game, db: AsyncSession) -> None:
-    """Shuffle the game deck"""
-    game_cards = list(await db.scalars(
-        select(GameCard).where(GameCard.game_id ==
-                               game.id and GameCard.location_type == CardLocation.DECK)
-    ))
-    random.shuffle(game_cards)
+def update_game_status(state: GameState) -> None:
+    """Evaluate the status of the game, starting a round once it is playing"""
+    previous_status = state.status
+    state.set_game(status=evaluate_game_status(state))
+
+    if previous_status == GameStatus.READY and state.status == GameStatus.PLAYING:
+        start_round(state)
 
-    for i, game_card in enumerate(game_cards):
-        setattr(game_card, "position", i)
-    await db.commit()
 
+def shuffle_deck(state: GameState) -> None:
+    """Return the discards to the game deck and shuffle it"""
+    state.restock()
+    state.set_game(shuffles=state.shuffles + 1)
+    state.shoe = shuffle_shoe(state.shoe, state.codes,
+                              state.shuffle_seed, state.shuffles)
+    state.emit("shoe_shuffled", shuffles=state.shuffles)
 
-async def start_round(game: Game, db: AsyncSession) -> None:
+
+def start_round(state: GameState) -> None:
     """Start a new round"""
-    participations = await db.scalars(
-        select(Participation).where(Participation.game_id == game.id))
+    state.set_game(hands_played=state.hands_played + 1)
+    state.emit("round_started", hands_played=state.hands_played)
 
-    setattr(game, 'hands_played', game.hands_played + 1)
-    await db.commit()
-    await deal_initial_hands(game, list(participations), db)
+    # Reshuffle once the cut card is reached or the deal would empty the shoe
+    cards_to_deal = 2 * (1 + sum(seat.status == ParticipationStatus.PLAYING
+                                 for seat in state.seats.values()))
+    if len(state.shoe) < max(len(state.codes) * (1 - PENETRATION), cards_to_deal):
+        shuffle_deck(state)
+
+    deal_initial_hands(state)
 
 
-async def deal_initial_hands(
-        game: Game, participations: list[Participation], db: AsyncSession) -> None:
+def deal_initial_hands(state: GameState) -> None:
     """Deal intial hands to participants and dealer"""
-    # Get the decks and distribute 2 random cards to each player
-    game_cards = list(await db.scalars(
-        select(GameCard)
-        .where(GameCard.game_id ==
-               game.id and GameCard.location_type == CardLocation.DECK)
-        .order_by(GameCard.position)
-    ))
+    active_seats = [
+        seat for seat in state.seats.values()
+        if seat.status == ParticipationStatus.PLAYING
+    ]
 
     # Distribute 2 cards to each player
-    for participation in participations:
-        for _ in range(2):
-            game_card = game_cards.pop()
-            setattr(game_card, 'holder_id', participation.id)
-            setattr(game_card, 'location_type', CardLocation.PLAYER_HAND)
+    for seat in active_seats:
+        state.deal(seat, 2)
+        state.set_seat(seat, hand_status=HandStatus.PLAYING)
 
     # Distribute 2 cards to the dealer
-    for _ in range(2):
-        game_card = game_cards.pop()
-        setattr(game_card, 'holder_id', game.id)
-        setattr(game_card, 'location_type', CardLocation.DEALER_HAND)
-    await db.commit()
+    state.deal_dealer(2)
+
+    # The second card of the dealer stays face down
+    state.emit("hands_dealt", hands=[
+        {'participation_id': seat.id, 'position': seat.position,
+         'cards': [state.card(card_id) for card_id in seat.hand]}
+        for seat in active_seats
+    ], dealer_up_card=state.card(state.dealer_hand[0]))
+
+    check_naturals(state)
+
+
+def check_naturals(state: GameState) -> None:
+    """Check for naturals and settle the round when they decide it"""
+    seats = [seat for seat in state.seats.values()
+             if seat.hand_status == HandStatus.PLAYING]
+
+    for seat in seats:
+        if seat.summary.value().natural:
+            state.set_seat(seat, hand_status=HandStatus.BLACKJACK)
+
+    # A dealer natural ends the round, as does a table of naturals
+    if state.dealer_summary.value().natural or all(
+            seat.hand_status == HandStatus.BLACKJACK for seat in seats):
+        settle_round(state)
+
+
+def draw_card(state: GameState, seat: SeatState) -> None:
+    """Draw one card for a hand, reshuffling the discards into an empty shoe"""
+    if not state.shoe:
+        shuffle_deck(state)
+    card_id, = state.deal(seat, 1)
+
+    if seat.summary.total > 21:
+        state.set_seat(seat, hand_status=HandStatus.BUSTED)
+    elif seat.summary.total == 21:
+        state.set_seat(seat, hand_status=HandStatus.STOOD)
+
+    state.emit("card_drawn", participation_id=seat.id, card=state.card(card_id),
+               total=seat.summary.total, hand_status=seat.hand_status)
+
+
+def hit(state: GameState, seat: SeatState) -> None:
+    """Draw a card, standing automatically on 21"""
+    draw_card(state, seat)
+    finish_round(state)
+
+
+def stand(state: GameState, seat: SeatState) -> None:
+    """Keep the hand as it is"""
+    state.set_seat(seat, hand_status=HandStatus.STOOD)
+    state.emit("hand_stood", participation_id=seat.id, total=seat.summary.total)
+    finish_round(state)
+
+
+def double(state: GameState, seat: SeatState) -> None:
+    """Double the bet of a two cards hand and draw exactly one more card"""
+    if seat.summary.cards != 2:
+        raise ValueError("Only a hand of two cards can be doubled")
+    if seat.cash < 2 * seat.bet:
+        raise ValueError("Not enough cash to double the bet")
+
+    state.set_seat(seat, bet=2 * seat.bet)
+    draw_card(state, seat)
+    if seat.hand_status == HandStatus.PLAYING:
+        state.set_seat(seat, hand_status=HandStatus.STOOD)
+    finish_round(state)
+
+
+def finish_round(state: GameState) -> None:
+    """Let the dealer play and settle the round once every hand is over"""
+    if any(seat.hand_status == HandStatus.PLAYING for seat in state.seats.values()):
+        return
+
+    play_dealer(state)
+    settle_round(state)
+
+
+def play_dealer(state: GameState) -> None:
+    """Draw for the dealer until DEALER_STANDS_ON, when a standing hand is left to beat"""
+    if not any(seat.hand_status == HandStatus.STOOD for seat in state.seats.values()):
+        return
+
+    while state.dealer_summary.total < DEALER_STANDS_ON:
+        if not state.shoe:
+            shuffle_deck(state)
+        state.deal_dealer(1)
+
+
+def payout(player_value: HandValue, dealer_value: HandValue, bet: int) -> int:
+    """Amount won by a player, negative when the bet is lost"""
+    if player_value.busted:
+        return -bet
+    if player_value.natural:
+        return 0 if dealer_value.natural else bet * NATURAL_PAYOUT[0] // NATURAL_PAYOUT[1]
+    if dealer_value.natural:
+        return -bet
+    if dealer_value.busted or player_value.total > dealer_value.total:
+        return bet
+    if player_value.total < dealer_value.total:
+        return -bet
+    return 0
+
+
+def settle_round(state: GameState) -> None:
+    """Pay every hand of the round against the bank and end the round
+
+    The payouts are computed in memory and flushed as cash deltas of the
+    participations and the bank, in the transaction of the action.
+    """
+    dealer_value = state.dealer_summary.value()
+    payouts = {
+        seat.id: payout(seat.summary.value(), dealer_value, seat.bet)
+        for seat in state.seats.values() if seat.hand
+    }
+    for seat_id, amount in payouts.items():
+        state.pay(state.seats[seat_id], amount)
+
+    dealer_hand = [state.card(card_id) for card_id in state.dealer_hand]
 
-    await check_naturals(game, participations, db)
+    end_round(state)
+    state.emit("round_settled", dealer_hand=dealer_hand, results=[
+        {'participation_id': seat_id, 'payout': amount, 'cash': state.seats[seat_id].cash}
+        for seat_id, amount in payouts.items()
+    ], bank=state.bank, status=state.status)
 
+    for seat_id in payouts:
+        seat = state.seats[seat_id]
+        if seat.status == ParticipationStatus.QUIT:
+            state.emit("participant_left", participation_id=seat.id,
+                       position=seat.position, cash=0, status=state.status)
 
-async def check_naturals(game: Game, participations: list[Participation], db: AsyncSession) -> None:
-    """Check for naturals"""
-    dealer_hand = list(await db.execute(
-        select(GameCard.id, PhysicalCard.rank)
-        .join(PhysicalCard, GameCard.physical_card_id == PhysicalCard.id)
-        .where(GameCard.game_id == game.id)
-        .where(GameCard.location_type == CardLocation.DEALER_HAND)
-        .where(GameCard.holder_id == game.id)
-    ))
 
-    for participation in participations:
-        player_hand = list(await db.execute(
-            select(GameCard.id, PhysicalCard.rank)
-            .join(PhysicalCard, GameCard.physical_card_id == PhysicalCard.id)
-            .where(GameCard.game_id == game.id)
-            .where(GameCard.location_type == CardLocation.PLAYER_HAND)
-            .where(GameCard.holder_id == participation.id)
-        ))
+def end_round(state: GameState) -> None:
+    """Discard the hands and reopen the game for bets"""
+    for card_id in state.dealer_hand:
+        state.discard(card_id)
+    state.dealer_hand = []
+    state.dealer_summary = HandSummary()
 
+    for seat in state.seats.values():
+        for card_id in seat.hand:
+            state.discard(card_id)
+        seat.hand = []
+        seat.summary = HandSummary()
+        if seat.bet or seat.hand_status != HandStatus.WAITING:
+            state.set_seat(seat, bet=0, hand_status=HandStatus.WAITING)
+        # A seat without cash could never bet again and hold the table back
+        if seat.status == ParticipationStatus.PLAYING and seat.cash == 0:
+            state.set_seat(seat, status=ParticipationStatus.QUIT)
 
-def hand_value(hand: list[GameCard]) -> int:
-    """Calculate the value of a hand"""
+    state.set_game(status=evaluate_game_status(state))
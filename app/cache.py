@@ -0,0 +1,192 @@
+"""Caches of the API"""
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Optional, TypeVar
+
+from app.config import settings
+from app.logger import logger
+from app.schemas import GamePage, GameRead
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """Values kept for ttl seconds, the least recently used ones evicted
+    beyond max_entries"""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, tuple[float, V]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """Get a value unless it has expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: V) -> None:
+        """Cache a value"""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Forget a value"""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Forget every value"""
+        self._entries.clear()
+
+
+class CacheBackend(ABC):
+    """Storage of serialized cache entries"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        """Get an entry"""
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        """Store an entry for ttl seconds"""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Remove an entry"""
+
+
+class LocalCacheBackend(CacheBackend):
+    """Entries in the memory of this process"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: dict[int, TTLCache[str]] = {}
+
+    def _cache(self, ttl: int) -> TTLCache[str]:
+        # One LRU per TTL, each entry expiring after the TTL it was stored with
+        cache = self._entries.get(ttl)
+        if cache is None:
+            cache = self._entries[ttl] = TTLCache(ttl=ttl, max_entries=self.max_entries)
+        return cache
+
+    async def get(self, key: str) -> Optional[str]:
+        for cache in self._entries.values():
+            value = cache.get(key)
+            if value is not None:
+                return value
+        return None
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        await self.delete(key)
+        self._cache(ttl).put(key, value)
+
+    async def delete(self, key: str) -> None:
+        for cache in self._entries.values():
+            cache.invalidate(key)
+
+
+class RedisCacheBackend(CacheBackend):
+    """Entries shared by the workers in a Redis compatible server
+
+    Works with any client exposing the get, set(ex=) and delete coroutines
+    of redis.asyncio.Redis created with decode_responses=True.
+    """
+
+    def __init__(self, client: Any):
+        self.client = client
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        await self.client.set(key, value, ex=ttl)
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(key)
+
+
+def create_cache_backend() -> CacheBackend:
+    """Backend set by CACHE_URL, in process memory when it is empty"""
+    if not settings.CACHE_URL:
+        return LocalCacheBackend(max_entries=settings.GAME_CACHE_MAX)
+
+    # Optional dependency, only needed to share the cache between workers
+    from redis import asyncio as redis
+    return RedisCacheBackend(redis.from_url(settings.CACHE_URL, decode_responses=True))
+
+
+class GameCache:
+    """Read-through cache of the GameRead payloads of games and lobby pages
+
+    A game entry is removed whenever the game row is written. Lobby pages
+    are stored under a generation token replaced on every game change, so
+    a page read before a change is never served after it. A game read
+    racing with a change may cache the old row, for ttl seconds at most.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+
+    async def _get(self, key: str) -> Optional[str]:
+        try:
+            return await self.backend.get(key)
+        except Exception:
+            logger.warning("Failed to read cache entry %s", key, exc_info=True)
+            return None
+
+    async def _set(self, key: str, value: str) -> None:
+        try:
+            await self.backend.set(key, value, self.ttl)
+        except Exception:
+            logger.warning("Failed to write cache entry %s", key, exc_info=True)
+
+    async def get_game(self, game_id: uuid.UUID) -> Optional[GameRead]:
+        """Get a cached game"""
+        value = await self._get(f"game:{game_id}")
+        return GameRead.model_validate_json(value) if value else None
+
+    async def put_game(self, game: GameRead) -> None:
+        """Cache a game"""
+        await self._set(f"game:{game.id}", game.model_dump_json())
+
+    async def lobby_generation(self) -> str:
+        """Token of the current version of the lobby"""
+        generation = await self._get("games:generation")
+        if generation is None:
+            generation = uuid.uuid4().hex
+            await self._set("games:generation", generation)
+        return generation
+
+    async def get_page(self, generation: str, query: str) -> Optional[GamePage]:
+        """Get a cached lobby page"""
+        value = await self._get(f"games:{generation}:{query}")
+        return GamePage.model_validate_json(value) if value else None
+
+    async def put_page(self, generation: str, query: str, games: GamePage) -> None:
+        """Cache a lobby page, read while the lobby was at a generation"""
+        await self._set(f"games:{generation}:{query}", games.model_dump_json())
+
+    async def invalidate(self, game_id: uuid.UUID) -> None:
+        """Forget a changed game and every lobby page"""
+        try:
+            await self.backend.delete(f"game:{game_id}")
+            await self.backend.set("games:generation", uuid.uuid4().hex, self.ttl)
+        except Exception:
+            logger.warning("Failed to invalidate game %s", game_id, exc_info=True)
+
+
+game_cache = GameCache(create_cache_backend(), ttl=settings.GAME_CACHE_TTL)
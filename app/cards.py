@@ -0,0 +1,85 @@
+"""Integer encoding of cards and hand evaluation
+
+A card is encoded as a small int in 0-51: suit index * 13 + rank index,
+following the declaration order of CardSuit and CardRank.
+"""
+from typing import NamedTuple, Sequence
+
+from app.enums import CardSuit, CardRank
+
+SUITS: tuple[CardSuit, ...] = tuple(CardSuit)
+RANKS: tuple[CardRank, ...] = tuple(CardRank)
+CARDS_PER_DECK = len(SUITS) * len(RANKS)
+
+_SUIT_INDEXES = {suit: i for i, suit in enumerate(SUITS)}
+_RANK_INDEXES = {rank: i for i, rank in enumerate(RANKS)}
+
+# Blackjack value of each rank, aces count as 1 and are promoted when soft
+RANK_VALUES: tuple[int, ...] = tuple(
+    1 if rank == CardRank.ACE
+    else int(rank.value) if rank.value.isdigit()
+    else 10
+    for rank in RANKS
+)
+
+# Lookup tables indexed by card code
+CARD_VALUES: tuple[int, ...] = tuple(
+    RANK_VALUES[code % len(RANKS)] for code in range(CARDS_PER_DECK))
+CARD_IS_ACE: tuple[bool, ...] = tuple(
+    RANKS[code % len(RANKS)] == CardRank.ACE for code in range(CARDS_PER_DECK))
+
+
+class HandValue(NamedTuple):
+    """Evaluation of a hand"""
+    total: int
+    soft: bool
+    natural: bool
+    busted: bool
+
+
+def encode_card(suit: CardSuit, rank: CardRank) -> int:
+    """Encode a card as an int in 0-51"""
+    return _SUIT_INDEXES[suit] * len(RANKS) + _RANK_INDEXES[rank]
+
+
+def decode_card(code: int) -> tuple[CardSuit, CardRank]:
+    """Decode a card code into its suit and rank"""
+    return SUITS[code // len(RANKS)], RANKS[code % len(RANKS)]
+
+
+class HandSummary:
+    """Running summary of a hand, updated as its cards are drawn"""
+    __slots__ = ('hard_total', 'aces', 'cards')
+
+    def __init__(self, hand: Sequence[int] = ()):
+        self.hard_total = 0
+        self.aces = 0
+        self.cards = 0
+        for code in hand:
+            self.add(code)
+
+    def add(self, code: int) -> None:
+        """Account for a drawn card"""
+        self.hard_total += CARD_VALUES[code]
+        self.aces += CARD_IS_ACE[code]
+        self.cards += 1
+
+    @property
+    def soft(self) -> bool:
+        """Whether an ace counts as 11"""
+        return self.aces > 0 and self.hard_total <= 11
+
+    @property
+    def total(self) -> int:
+        """Best total of the hand"""
+        return self.hard_total + 10 if self.soft else self.hard_total
+
+    def value(self) -> HandValue:
+        """Evaluation of the hand"""
+        total = self.total
+        return HandValue(
+            total=total,
+            soft=self.soft,
+            natural=total == 21 and self.cards == 2,
+            busted=total > 21,
+        )
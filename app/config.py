@@ -9,9 +9,35 @@ class Settings:
     """Application settings"""
     DB_URL = os.getenv(
         "DB_URL", "postgresql+asyncpg://user:password@db/trump_db")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))  # seconds, -1 to never recycle
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+    DB_PREPARED_STATEMENT_CACHE_SIZE = int(
+        os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", "100"))  # asyncpg only
     SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
     TOKEN_LIFETIME = int(os.getenv("TOKEN_LIFETIME", "3600"))  # 1 hour
+    REFRESH_TOKEN_LIFETIME = int(
+        os.getenv("REFRESH_TOKEN_LIFETIME", "2592000"))  # 30 days
+    PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "60"))  # seconds
+    PRINCIPAL_CACHE_MAX = int(os.getenv("PRINCIPAL_CACHE_MAX", "10000"))
+    PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
+    PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "200"))
+    IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))  # 1 day
+    IDEMPOTENCY_CACHE_MAX = int(os.getenv("IDEMPOTENCY_CACHE_MAX", "10000"))
+    IDEMPOTENCY_PURGE_INTERVAL = int(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "3600"))  # seconds
+    CACHE_URL = os.getenv("CACHE_URL", "")  # redis://..., empty for an in-process cache
+    GAME_CACHE_TTL = int(os.getenv("GAME_CACHE_TTL", "30"))  # seconds
+    GAME_CACHE_MAX = int(os.getenv("GAME_CACHE_MAX", "10000"))
     LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
+    ENGINE_MAX_GAMES = int(os.getenv("ENGINE_MAX_GAMES", "10000"))
+    GAME_LOCK_MODE = os.getenv("GAME_LOCK_MODE", "local")  # local or advisory
+    GAME_LOCKS_MAX = int(os.getenv("GAME_LOCKS_MAX", "10000"))
+    EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))  # per subscriber
+    SIMULATION_WORKERS = int(os.getenv("SIMULATION_WORKERS", "0"))  # 0 for one per core
+    SIMULATION_MAX_ROUNDS = int(os.getenv("SIMULATION_MAX_ROUNDS", "10000000"))
 
 
 settings = Settings()
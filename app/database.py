@@ -1,11 +1,17 @@
 """Database module"""
-from urllib.parse import urlparse
+import asyncio
+import time
+from typing import Optional
 
+from asyncpg.exceptions import InvalidCatalogNameError
 from fastapi import Depends
 from fastapi_users.db import SQLAlchemyUserDatabase
-from sqlalchemy import create_engine, text
+from sqlalchemy import make_url, text
 from sqlalchemy.exc import OperationalError, ProgrammingError
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine,
+)
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 
 from app.config import settings
 from app.logger import logger
@@ -13,81 +19,165 @@ from app.logger import logger
 from app.models import User
 
 
-def get_postgres_info(url: str):
-    """Extract PostgreSQL connection info from URL"""
-    parsed = urlparse(url)
-
-    # Convert async URL to sync for database creation
-    sync_url = url.replace('+asyncpg', '+psycopg')
-
-    db_name = parsed.path.lstrip('/')
-    server_url = f"postgresql+psycopg://{parsed.netloc}/postgres"
-
-    return {
-        'db_name': db_name,
-        'server_url': server_url,
-        'sync_url': sync_url,
-        'host': parsed.hostname,
-        'port': parsed.port or 5432,
-        'username': parsed.username,
-        'password': parsed.password
-    }
-
-
-def create_postgres_database():
+async def provision_database():
     """Create PostgreSQL database if it doesn't exist"""
-    db_info = get_postgres_info(settings.DB_URL)
+    # Other databases, like the SQLite stand-in of the benchmarks, are not provisioned
+    if not settings.DB_URL.startswith('postgresql'):
+        return
+
+    url = make_url(settings.DB_URL)
+    db_name = url.database
 
     try:
         # Try connecting to the target database
-        test_engine = create_engine(db_info['sync_url'])
-        with test_engine.connect():
-            logger.info(
-                f"PostgreSQL database '{db_info['db_name']}' already exists")
-        test_engine.dispose()
-        return
+        test_engine = create_async_engine(url, poolclass=NullPool)
+        try:
+            async with test_engine.connect():
+                logger.info(
+                    f"PostgreSQL database '{db_name}' already exists")
+            return
+        finally:
+            await test_engine.dispose()
 
-    except (OperationalError, ProgrammingError):
+    # asyncpg raises its own error for a missing database, unwrapped at connect
+    except (OperationalError, ProgrammingError, InvalidCatalogNameError):
         # Database doesn't exist, create it
         logger.info(
-            f"PostgreSQL database '{db_info['db_name']}' doesn't exist. Creating...")
+            f"PostgreSQL database '{db_name}' doesn't exist. Creating...")
 
-        try:
-            # Connect to postgres default database
-            temp_engine = create_engine(
-                db_info['server_url'],
-                isolation_level="AUTOCOMMIT"  # Required for CREATE DATABASE
+    try:
+        # Connect to postgres default database
+        temp_engine = create_async_engine(
+            url.set(database='postgres'),
+            poolclass=NullPool,
+            isolation_level="AUTOCOMMIT"  # Required for CREATE DATABASE
+        )
+
+        async with temp_engine.connect() as conn:
+            # Check if database exists first
+            result = await conn.execute(
+                text("SELECT 1 FROM pg_database WHERE datname = :dbname"),
+                {"dbname": db_name}
             )
 
-            with temp_engine.connect() as conn:
-                # Check if database exists first
-                result = conn.execute(
-                    text("SELECT 1 FROM pg_database WHERE datname = :dbname"),
-                    {"dbname": db_info['db_name']}
-                )
+            if result.fetchone() is None:
+                # Create the database
+                await conn.execute(text(f'CREATE DATABASE "{db_name}"'))
+                logger.info(
+                    f"PostgreSQL database '{db_name}' created successfully!")
+            else:
+                logger.info(
+                    f"PostgreSQL database '{db_name}' already exists")
+
+        await temp_engine.dispose()
+
+    except Exception as e:
+        logger.error(f"Failed to create PostgreSQL database: {e}")
+        raise
+
+
+class PoolMetrics:
+    """Connection checkouts and time spent waiting for a connection"""
 
-                if result.fetchone() is None:
-                    # Create the database
-                    conn.execute(
-                        text(f'CREATE DATABASE "{db_info["db_name"]}"'))
-                    logger.info(
-                        f"PostgreSQL database '{db_info['db_name']}' created successfully!")
-                else:
-                    logger.info(
-                        f"PostgreSQL database '{db_info['db_name']}' already exists")
+    def __init__(self):
+        self.waiters = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
 
-            temp_engine.dispose()
+    def record_wait(self, seconds: float) -> None:
+        """Record the wait of a checkout"""
+        self.waits += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
 
-        except Exception as e:
-            logger.error(f"Failed to create PostgreSQL database: {e}")
-            raise
 
+pool_metrics = PoolMetrics()
 
-# Create the database first
-create_postgres_database()
 
-engine = create_async_engine(settings.DB_URL)
-AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool recording how long checkouts wait for a connection"""
+
+    def _do_get(self):
+        pool_metrics.checkouts += 1
+
+        # Only a checkout finding no idle connection and no overflow left
+        # waits, opening a connection is not waiting for the pool
+        if not (0 <= self._max_overflow <= self._overflow and self._pool.empty()):
+            return super()._do_get()
+
+        pool_metrics.waiters += 1
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_metrics.waiters -= 1
+            pool_metrics.record_wait(time.perf_counter() - start)
+
+
+def create_engine_from_settings() -> AsyncEngine:
+    """Create the async engine with the pool settings"""
+    connect_args = {}
+    if settings.DB_URL.startswith('postgresql+asyncpg'):
+        connect_args['prepared_statement_cache_size'] = settings.DB_PREPARED_STATEMENT_CACHE_SIZE
+
+    return create_async_engine(
+        settings.DB_URL,
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        query_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+        connect_args=connect_args,
+    )
+
+
+def get_pool_status() -> dict:
+    """Current state of the connection pool"""
+    pool = get_engine().pool
+    return {
+        'size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        'overflow': pool.overflow(),
+        'waiters': pool_metrics.waiters,
+        'checkouts': pool_metrics.checkouts,
+        'waits': pool_metrics.waits,
+        'wait_ms_total': pool_metrics.wait_seconds_total * 1000,
+        'wait_ms_max': pool_metrics.wait_seconds_max * 1000,
+    }
+
+
+# Bound to the engine when it is initialized, at application startup
+AsyncSessionLocal = async_sessionmaker(expire_on_commit=False)
+_engine: Optional[AsyncEngine] = None
+
+
+def init_engine() -> AsyncEngine:
+    """Create the engine of the process, without connecting yet"""
+    global _engine
+    if _engine is None:
+        _engine = create_engine_from_settings()
+        AsyncSessionLocal.configure(bind=_engine)
+    return _engine
+
+
+def get_engine() -> AsyncEngine:
+    """Get the engine of the process"""
+    if _engine is None:
+        raise RuntimeError("The database engine is not initialized")
+    return _engine
+
+
+async def dispose_engine() -> None:
+    """Close the connections of the engine"""
+    global _engine
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
 
 
 async def get_db():
@@ -101,3 +191,7 @@ async def get_db():
 
 async def get_user_db(session: AsyncSession = Depends(get_db)):
     yield SQLAlchemyUserDatabase(session, User)
+
+
+if __name__ == "__main__":
+    asyncio.run(provision_database())
@@ -0,0 +1,440 @@
+"""In-memory state of the active games"""
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import bindparam, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Game, Participation, GameCard, User
+from app.enums import GameStatus, GameVariant, ParticipationStatus, CardLocation, HandStatus
+from app.cache import game_cache
+from app.cards import HandSummary, decode_card, encode_card
+from app.config import settings
+from app.events import game_events
+from app.logger import logger
+
+
+class SeatState:
+    """Live state of a participation"""
+    __slots__ = ('id', 'game_id', 'user_id', 'position', 'status',
+                 'hand_status', 'bet', 'cash', 'created_at', 'hand', 'summary')
+
+    def __init__(self, participation: Participation):
+        self.id: uuid.UUID = participation.id
+        self.game_id: uuid.UUID = getattr(participation, 'game_id')
+        self.user_id: uuid.UUID = getattr(participation, 'user_id')
+        self.position: int = getattr(participation, 'position')
+        self.status: ParticipationStatus = getattr(participation, 'status')
+        self.hand_status: HandStatus = getattr(participation, 'hand_status')
+        self.bet: int = getattr(participation, 'bet')
+        self.cash: int = getattr(participation, 'cash')
+        self.created_at: datetime = getattr(participation, 'created_at')
+        self.hand: list[uuid.UUID] = []
+        self.summary = HandSummary()
+
+    def to_dict(self) -> dict:
+        """Participation fields of the seat"""
+        return {
+            'id': self.id,
+            'position': self.position,
+            'status': self.status,
+            'hand_status': self.hand_status,
+            'bet': self.bet,
+            'cash': self.cash,
+            'created_at': self.created_at,
+            'game_id': self.game_id,
+            'user_id': self.user_id,
+        }
+
+
+class GameState:
+    """Live state of a game, with the changes waiting to be flushed"""
+    __slots__ = ('id', 'variant', 'status', 'hands_played', 'bank',
+                 'shuffle_seed', 'shuffles',
+                 'shoe', 'discards', 'dealer_hand', 'dealer_summary', 'seats', 'codes',
+                 'game_dirty', 'dirty_seats', 'moved_cards', 'shoe_dirty', 'drawn',
+                 'bank_delta', 'cash_deltas', 'user_deltas', 'events')
+
+    def __init__(self, game: Game):
+        self.id: uuid.UUID = game.id
+        self.variant: GameVariant = getattr(game, 'variant')
+        self.status: GameStatus = getattr(game, 'status')
+        self.hands_played: int = getattr(game, 'hands_played')
+        self.bank: int = getattr(game, 'bank')
+        self.shuffle_seed: int = getattr(game, 'shuffle_seed')
+        self.shuffles: int = getattr(game, 'shuffles')
+        # Cards left in the shoe ordered by position, the top card is the last one
+        self.shoe: list[uuid.UUID] = []
+        self.discards: list[uuid.UUID] = []
+        self.dealer_hand: list[uuid.UUID] = []
+        self.dealer_summary = HandSummary()
+        # Seats ordered by position
+        self.seats: dict[uuid.UUID, SeatState] = {}
+        # Integer code of every card of the game
+        self.codes: dict[uuid.UUID, int] = {}
+        self.game_dirty = False
+        self.dirty_seats: set[uuid.UUID] = set()
+        self.moved_cards: dict[uuid.UUID,
+                               tuple[CardLocation, Optional[uuid.UUID]]] = {}
+        self.shoe_dirty = False
+        # Cards drawn since the shoe was restocked, in drawing order
+        self.drawn: list[uuid.UUID] = []
+        # Cash moves, written as relative updates of the balances
+        self.bank_delta = 0
+        self.cash_deltas: dict[uuid.UUID, int] = {}
+        self.user_deltas: dict[uuid.UUID, int] = {}
+        # Events published once the changes are flushed
+        self.events: list[tuple[str, dict]] = []
+
+    @property
+    def dirty(self) -> bool:
+        """Whether the state has changes waiting to be flushed"""
+        return bool(self.game_dirty or self.dirty_seats
+                    or self.moved_cards or self.shoe_dirty
+                    or self.bank_delta or self.cash_deltas or self.user_deltas)
+
+    def set_game(self, **fields) -> None:
+        """Update game fields"""
+        for key, value in fields.items():
+            setattr(self, key, value)
+        self.game_dirty = True
+
+    def set_seat(self, seat: SeatState, **fields) -> None:
+        """Update participation fields of a seat"""
+        for key, value in fields.items():
+            setattr(seat, key, value)
+        self.dirty_seats.add(seat.id)
+
+    def pay(self, seat: SeatState, amount: int) -> None:
+        """Move an amount from the bank to a seat, negative when the seat loses"""
+        seat.cash += amount
+        self.bank -= amount
+        self.cash_deltas[seat.id] = self.cash_deltas.get(seat.id, 0) + amount
+        self.bank_delta -= amount
+
+    def cash_out(self, seat: SeatState) -> int:
+        """Give the cash of a seat back to its user"""
+        amount, seat.cash = seat.cash, 0
+        self.cash_deltas[seat.id] = self.cash_deltas.get(seat.id, 0) - amount
+        self.user_deltas[seat.user_id] = self.user_deltas.get(seat.user_id, 0) + amount
+        return amount
+
+    def emit(self, event_type: str, **data) -> None:
+        """Queue an event for the clients following the game"""
+        self.events.append((event_type, data))
+
+    def card(self, card_id: uuid.UUID) -> dict:
+        """Suit and rank of a card, as sent to the clients"""
+        suit, rank = decode_card(self.codes[card_id])
+        return {'suit': suit.value, 'rank': rank.value}
+
+    def move_card(self, card_id: uuid.UUID, location: CardLocation,
+                  holder_id: Optional[uuid.UUID]) -> None:
+        """Record a card leaving the shoe or a hand"""
+        self.moved_cards[card_id] = (location, holder_id)
+
+    def draw(self, count: int, location: CardLocation,
+             holder_id: uuid.UUID) -> list[uuid.UUID]:
+        """Take cards from the top of the shoe and give them to a holder"""
+        if count > len(self.shoe):
+            raise ValueError(f"Cannot draw {count} cards from a shoe of {len(self.shoe)}")
+
+        cards = self.shoe[-count:]
+        del self.shoe[-count:]
+        cards.reverse()
+        for card_id in cards:
+            self.move_card(card_id, location, holder_id)
+        if self.shoe_dirty:
+            self.drawn.extend(cards)
+        return cards
+
+    def deal(self, seat: SeatState, count: int) -> list[uuid.UUID]:
+        """Draw cards into the hand of a seat"""
+        cards = self.draw(count, CardLocation.PLAYER_HAND, seat.id)
+        seat.hand.extend(cards)
+        for card_id in cards:
+            seat.summary.add(self.codes[card_id])
+        return cards
+
+    def deal_dealer(self, count: int) -> list[uuid.UUID]:
+        """Draw cards into the hand of the dealer"""
+        cards = self.draw(count, CardLocation.DEALER_HAND, self.id)
+        self.dealer_hand.extend(cards)
+        for card_id in cards:
+            self.dealer_summary.add(self.codes[card_id])
+        return cards
+
+    def restock(self) -> None:
+        """Return the discard pile to the shoe, whose order must then be rewritten"""
+        for card_id in self.discards:
+            self.moved_cards.pop(card_id, None)
+        self.shoe.extend(self.discards)
+        self.discards = []
+        self.shoe_dirty = True
+
+        # Cards still in hands get positions above the shoe, in dealing order
+        self.drawn = list(self.dealer_hand)
+        for card_id in self.dealer_hand:
+            self.move_card(card_id, CardLocation.DEALER_HAND, self.id)
+        for seat in self.seats.values():
+            self.drawn.extend(seat.hand)
+            for card_id in seat.hand:
+                self.move_card(card_id, CardLocation.PLAYER_HAND, seat.id)
+
+    def discard(self, card_id: uuid.UUID) -> None:
+        """Put a card on the discard pile"""
+        self.discards.append(card_id)
+        self.move_card(card_id, CardLocation.DISCARD, None)
+
+    def hand_codes(self, hand: list[uuid.UUID]) -> list[int]:
+        """Integer codes of the cards of a hand"""
+        return [self.codes[card_id] for card_id in hand]
+
+
+_MOVE_CARDS = text("""
+    UPDATE game_cards
+    SET location_type = CAST(moves.location_type AS cardlocation),
+        holder_id = moves.holder_id
+    FROM unnest(CAST(:ids AS uuid[]), CAST(:locations AS text[]), CAST(:holders AS uuid[]))
+        AS moves(id, location_type, holder_id)
+    WHERE game_cards.id = moves.id
+""")
+
+
+_RESTOCK_SHOE = text("""
+    UPDATE game_cards
+    SET position = shoe.position - 1, location_type = 'DECK', holder_id = NULL
+    FROM unnest(CAST(:ids AS uuid[])) WITH ORDINALITY AS shoe(id, position)
+    WHERE game_cards.id = shoe.id
+""")
+
+
+async def _restock_shoe(shoe: list[uuid.UUID], db: AsyncSession) -> None:
+    """Write the order of the whole shoe, in a single statement on Postgres"""
+    if db.get_bind().dialect.name != 'postgresql':
+        await db.execute(update(GameCard), [
+            {'id': card_id, 'position': position,
+             'location_type': CardLocation.DECK, 'holder_id': None}
+            for position, card_id in enumerate(shoe)
+        ])
+        return
+
+    await db.execute(_RESTOCK_SHOE, {'ids': shoe})
+
+
+_ADD_CASH = {
+    table: text(f"""
+        UPDATE {table}
+        SET cash = {table}.cash + deltas.delta
+        FROM unnest(CAST(:ids AS uuid[]), CAST(:deltas AS integer[])) AS deltas(id, delta)
+        WHERE {table}.id = deltas.id
+    """)
+    for table in ('participations', 'users')
+}
+
+
+async def _add_cash(model: type[Participation] | type[User],
+                    deltas: dict[uuid.UUID, int], db: AsyncSession) -> None:
+    """Add amounts to the cash of rows, in a single statement on Postgres"""
+    if db.get_bind().dialect.name != 'postgresql':
+        table = model.__table__
+        await db.execute(
+            update(table)
+            .where(table.c.id == bindparam('row_id'))
+            .values(cash=table.c.cash + bindparam('delta')),
+            [{'row_id': row_id, 'delta': delta} for row_id, delta in deltas.items()]
+        )
+        return
+
+    await db.execute(_ADD_CASH[model.__tablename__], {
+        'ids': list(deltas), 'deltas': list(deltas.values())})
+
+
+async def _move_cards(
+        moved_cards: dict[uuid.UUID, tuple[CardLocation, Optional[uuid.UUID]]],
+        db: AsyncSession) -> None:
+    """Write card moves, in a single statement on Postgres"""
+    if db.get_bind().dialect.name != 'postgresql':
+        await db.execute(update(GameCard), [
+            {'id': card_id, 'location_type': location, 'holder_id': holder_id}
+            for card_id, (location, holder_id) in moved_cards.items()
+        ])
+        return
+
+    await db.execute(_MOVE_CARDS, {
+        'ids': list(moved_cards),
+        'locations': [location.name for location, _ in moved_cards.values()],
+        'holders': [holder_id for _, holder_id in moved_cards.values()],
+    })
+
+
+class GameEngine:
+    """Keep the live state of active games and persist it in batches"""
+
+    def __init__(self, max_games: int):
+        self.max_games = max_games
+        self._games: OrderedDict[uuid.UUID, GameState] = OrderedDict()
+        self._seat_games: dict[uuid.UUID, uuid.UUID] = {}
+
+    def register(self, state: GameState) -> None:
+        """Cache the state of a game"""
+        self._games[state.id] = state
+        self._games.move_to_end(state.id)
+        for seat_id in state.seats:
+            self._seat_games[seat_id] = state.id
+
+        # Forget the least recently used games, their rows are up to date
+        while len(self._games) > self.max_games:
+            _, evicted = self._games.popitem(last=False)
+            self._forget_seats(evicted)
+
+    def evict(self, game_id: uuid.UUID) -> None:
+        """Forget the state of a game"""
+        state = self._games.pop(game_id, None)
+        if state is not None:
+            self._forget_seats(state)
+
+    def _forget_seats(self, state: GameState) -> None:
+        for seat_id in state.seats:
+            self._seat_games.pop(seat_id, None)
+
+    def add_seat(self, participation: Participation) -> None:
+        """Add a new participation to a cached game"""
+        state = self._games.get(getattr(participation, 'game_id'))
+        if state is None:
+            return
+        state.seats[participation.id] = SeatState(participation)
+        self._seat_games[participation.id] = state.id
+
+    async def locate(self, participation_id: uuid.UUID, db: AsyncSession) -> Optional[uuid.UUID]:
+        """Get the game id of a participation"""
+        game_id = self._seat_games.get(participation_id)
+        if game_id is not None:
+            return game_id
+
+        return await db.scalar(
+            select(Participation.game_id).where(
+                Participation.id == participation_id)
+        )
+
+    async def load(self, game_id: uuid.UUID, db: AsyncSession) -> Optional[GameState]:
+        """Get the state of a game, loading it from the database when not cached"""
+        state = self._games.get(game_id)
+        if state is not None:
+            self._games.move_to_end(game_id)
+            return state
+
+        game = await db.get(Game, game_id)
+        if not game:
+            return None
+
+        state = GameState(game)
+        participations = await db.scalars(
+            select(Participation)
+            .where(Participation.game_id == game_id)
+            .order_by(Participation.position)
+        )
+        for participation in participations:
+            state.seats[participation.id] = SeatState(participation)
+
+        game_cards = await db.execute(
+            select(GameCard.id, GameCard.suit, GameCard.rank,
+                   GameCard.location_type, GameCard.holder_id)
+            .where(GameCard.game_id == game_id)
+            .order_by(GameCard.position)
+        )
+        for card_id, suit, rank, location_type, holder_id in game_cards:
+            state.codes[card_id] = encode_card(suit, rank)
+            if location_type == CardLocation.DECK:
+                state.shoe.append(card_id)
+            elif location_type == CardLocation.DISCARD:
+                state.discards.append(card_id)
+            elif location_type == CardLocation.DEALER_HAND:
+                state.dealer_hand.append(card_id)
+            elif holder_id in state.seats:
+                state.seats[holder_id].hand.append(card_id)
+
+        # Cards are dealt from the top of the shoe, so hands are in reverse position order
+        state.dealer_hand.reverse()
+        state.dealer_summary = HandSummary(state.hand_codes(state.dealer_hand))
+        for seat in state.seats.values():
+            seat.hand.reverse()
+            seat.summary = HandSummary(state.hand_codes(seat.hand))
+
+        self.register(state)
+        return state
+
+    async def flush(self, state: GameState, db: AsyncSession) -> None:
+        """Persist the pending changes of a game in one transaction, then
+        publish its events"""
+        events, state.events = state.events, []
+        if not state.dirty:
+            return
+        game_changed = state.game_dirty or state.bank_delta != 0
+
+        try:
+            # Balances are moved by deltas, never overwritten with cached values
+            if game_changed:
+                await db.execute(
+                    update(Game)
+                    .where(Game.id == state.id)
+                    .values(status=state.status,
+                            hands_played=state.hands_played,
+                            shuffles=state.shuffles,
+                            bank=Game.bank + state.bank_delta)
+                )
+
+            if state.dirty_seats:
+                await db.execute(update(Participation), [
+                    {
+                        'id': seat.id,
+                        'status': seat.status,
+                        'hand_status': seat.hand_status,
+                        'bet': seat.bet,
+                    }
+                    for seat in (state.seats[seat_id] for seat_id in state.dirty_seats)
+                ])
+
+            if state.cash_deltas:
+                await _add_cash(Participation, state.cash_deltas, db)
+
+            if state.user_deltas:
+                await _add_cash(User, state.user_deltas, db)
+
+            # The shoe as shuffled gives their positions to the cards drawn
+            # since, whose moves are written after it
+            if state.shoe_dirty:
+                await _restock_shoe(state.shoe + state.drawn[::-1], db)
+
+            if state.moved_cards:
+                await _move_cards(state.moved_cards, db)
+
+            await db.commit()
+        except Exception:
+            # The rows are the source of truth, reload them on next access
+            logger.error("Failed to flush game %s, evicting its state", state.id)
+            self.evict(state.id)
+            raise
+
+        state.game_dirty = False
+        state.dirty_seats.clear()
+        state.moved_cards.clear()
+        state.shoe_dirty = False
+        state.drawn.clear()
+        state.bank_delta = 0
+        state.cash_deltas.clear()
+        state.user_deltas.clear()
+
+        if state.status == GameStatus.FINISHED:
+            self.evict(state.id)
+
+        if game_changed:
+            await game_cache.invalidate(state.id)
+
+        for event_type, data in events:
+            await game_events.publish(state.id, event_type, data)
+
+
+game_engine = GameEngine(max_games=settings.ENGINE_MAX_GAMES)
@@ -52,3 +52,12 @@ class ParticipationStatus(enum.Enum):
     """Participation statuses"""
     PLAYING = "playing"
     QUIT = "quit"
+
+
+class HandStatus(enum.Enum):
+    """Hand statuses of a participation during a round"""
+    WAITING = "waiting"
+    PLAYING = "playing"
+    STOOD = "stood"
+    BUSTED = "busted"
+    BLACKJACK = "blackjack"
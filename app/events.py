@@ -0,0 +1,96 @@
+"""Publication of game events to the clients following a game
+
+Events are JSON messages published on the channel of their game once the
+action producing them is committed. The in-process LocalBroker fans them
+out to the subscribers of the worker; deployments running several workers
+plug a shared broker implementing the Broker interface with use_broker.
+"""
+import asyncio
+import enum
+import json
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import AsyncContextManager, AsyncIterator
+
+from app.config import settings
+from app.logger import logger
+
+
+def _json_default(value):
+    """Encode the enums and ids of the events"""
+    return value.value if isinstance(value, enum.Enum) else str(value)
+
+
+class Broker(ABC):
+    """Transport of the messages of the game channels"""
+
+    @abstractmethod
+    async def publish(self, channel: str, message: str) -> None:
+        """Send a message to the subscribers of a channel"""
+
+    @abstractmethod
+    def subscribe(self, channel: str) -> AsyncContextManager[AsyncIterator[str]]:
+        """Follow a channel, yielding an iterator of its messages"""
+
+
+class LocalBroker(Broker):
+    """Fan-out of the messages to the subscribers of this process"""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._channels: dict[str, set[asyncio.Queue]] = {}
+
+    async def publish(self, channel: str, message: str) -> None:
+        for queue in self._channels.get(channel, ()):
+            if queue.full():
+                # A slow subscriber loses its oldest messages, not the others
+                queue.get_nowait()
+                logger.warning("Subscriber of %s is lagging, dropping a message", channel)
+            queue.put_nowait(message)
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str) -> AsyncIterator[AsyncIterator[str]]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._channels.setdefault(channel, set()).add(queue)
+
+        async def messages() -> AsyncIterator[str]:
+            while True:
+                yield await queue.get()
+
+        try:
+            yield messages()
+        finally:
+            subscribers = self._channels[channel]
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._channels[channel]
+
+
+class GameEvents:
+    """Game events published through a broker"""
+
+    def __init__(self, broker: Broker):
+        self.broker = broker
+
+    def use_broker(self, broker: Broker) -> None:
+        """Replace the broker, before any subscription"""
+        self.broker = broker
+
+    async def publish(self, game_id: uuid.UUID, event_type: str, data: dict) -> None:
+        """Publish an event of a game, never failing the action producing it"""
+        message = json.dumps({'type': event_type, 'game_id': game_id, **data},
+                             default=_json_default)
+        try:
+            await self.broker.publish(f"game:{game_id}", message)
+        except Exception:
+            logger.exception("Failed to publish %s event of game %s", event_type, game_id)
+
+    @asynccontextmanager
+    async def subscribe(self, game_id: uuid.UUID) -> AsyncIterator[AsyncIterator[str]]:
+        """Follow the events of a game"""
+        async with self.broker.subscribe(f"game:{game_id}") as messages:
+            yield messages
+
+
+game_events = GameEvents(LocalBroker(queue_size=settings.EVENT_QUEUE_SIZE))
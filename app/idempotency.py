@@ -0,0 +1,146 @@
+"""Replay of the requests sent with an Idempotency-Key header
+
+A client retrying a charge, a buy-in or a bet after losing the response
+sends the same Idempotency-Key, and gets the first response back instead
+of the action being applied twice. Keys belong to a user. The response is
+stored in the transaction of the action, and kept in memory for the
+retries that follow closely.
+"""
+import asyncio
+import hashlib
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, NamedTuple, Optional
+
+from fastapi import Header, HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import TTLCache
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.logger import logger
+from app.models import IdempotencyKey
+
+
+class StoredResponse(NamedTuple):
+    """Response of a request, with the fingerprint of the request"""
+    fingerprint: str
+    status_code: int
+    body: Any
+
+
+idempotency_cache: TTLCache[StoredResponse] = TTLCache(
+    ttl=settings.IDEMPOTENCY_KEY_TTL, max_entries=settings.IDEMPOTENCY_CACHE_MAX)
+
+
+class IdempotentRequest:
+    """Idempotency-Key of a request and the response stored under it"""
+
+    def __init__(self, key: Optional[str], fingerprint: str):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.user_id: Optional[uuid.UUID] = None
+        self.stored: Optional[StoredResponse] = None
+
+    async def replay(self, user_id: uuid.UUID, db: AsyncSession) -> Optional[JSONResponse]:
+        """Get the response of a request already played with the same key"""
+        if self.key is None:
+            return None
+
+        self.user_id = user_id
+        stored = idempotency_cache.get((user_id, self.key))
+        if stored is None:
+            row = await db.get(IdempotencyKey, (user_id, self.key))
+            if row is not None and _expired(row):
+                # The key can be used again, the row is replaced by the next save
+                await db.delete(row)
+            elif row is not None:
+                stored = StoredResponse(getattr(row, 'fingerprint'), getattr(row, 'status_code'),
+                                        getattr(row, 'response'))
+                idempotency_cache.put((user_id, self.key), stored)
+
+        if stored is None:
+            return None
+
+        if stored.fingerprint != self.fingerprint:
+            raise HTTPException(
+                status_code=422, detail="Idempotency-Key already used by another request")
+
+        return JSONResponse(stored.body, status_code=stored.status_code)
+
+    def save(self, response: BaseModel, db: AsyncSession, status_code: int = 200) -> None:
+        """Store the response with the changes of the action, before they are committed"""
+        if self.key is None:
+            return
+
+        self.stored = StoredResponse(self.fingerprint, status_code,
+                                     response.model_dump(mode="json"))
+        db.add(IdempotencyKey(
+            user_id=self.user_id,
+            key=self.key,
+            fingerprint=self.fingerprint,
+            status_code=status_code,
+            response=self.stored.body,
+        ))
+
+
+def _expiry() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+
+
+def _expired(row: IdempotencyKey) -> bool:
+    created_at: datetime = getattr(row, 'created_at')
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at < _expiry()
+
+
+async def purge_expired_keys(db: AsyncSession) -> int:
+    """Delete the keys older than their TTL, returning how many were deleted"""
+    result = await db.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.created_at < _expiry()))
+    await db.commit()
+    return getattr(result, 'rowcount')
+
+
+async def purge_expired_keys_periodically() -> None:
+    """Purge the expired keys at startup, then every IDEMPOTENCY_PURGE_INTERVAL seconds"""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                purged = await purge_expired_keys(db)
+            logger.info("Purged %d expired idempotency keys", purged)
+        except Exception:
+            logger.exception("Failed to purge expired idempotency keys")
+        await asyncio.sleep(settings.IDEMPOTENCY_PURGE_INTERVAL)
+
+
+async def idempotent_request(
+    request: Request,
+    idempotency_key: Optional[str] = Header(default=None, max_length=255)
+) -> AsyncIterator[IdempotentRequest]:
+    """Get the Idempotency-Key of a request, caching its response once committed"""
+    fingerprint = ""
+    if idempotency_key is not None:
+        fingerprint = hashlib.sha256(
+            f"{request.method} {request.url.path}\n".encode() + await request.body()
+        ).hexdigest()
+    idempotent = IdempotentRequest(idempotency_key, fingerprint)
+
+    try:
+        yield idempotent
+    except IntegrityError as exc:
+        # Another request with the same key has committed first
+        if idempotent.stored is None:
+            raise
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this Idempotency-Key is already being processed"
+        ) from exc
+
+    if idempotent.stored is not None:
+        idempotency_cache.put((idempotent.user_id, idempotent.key), idempotent.stored)
@@ -0,0 +1,85 @@
+"""Serialization of the actions played on a game"""
+import asyncio
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.engine import game_engine
+from app.config import settings
+
+
+class _GameLock:
+    """Lock of a game with the number of actions holding or awaiting it"""
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+def advisory_key(game_id: uuid.UUID) -> int:
+    """Signed 64 bits key of a game for Postgres advisory locks"""
+    return int.from_bytes(game_id.bytes[:8], 'big', signed=True)
+
+
+class GameLocks:
+    """Registry of per-game locks with LRU eviction
+
+    In "local" mode actions are serialized with asyncio locks, which is
+    enough for a single worker. In "advisory" mode a transaction-level
+    Postgres advisory lock is also taken, so several workers can serve
+    the same game; the cached game state is then reloaded under the lock.
+    """
+
+    def __init__(self, max_locks: int, mode: str):
+        if mode not in ('local', 'advisory'):
+            raise ValueError(f"Unknown game lock mode: {mode}")
+        self.max_locks = max_locks
+        self.mode = mode
+        self._locks: OrderedDict[uuid.UUID, _GameLock] = OrderedDict()
+
+    def _acquire_entry(self, game_id: uuid.UUID) -> _GameLock:
+        entry = self._locks.get(game_id)
+        if entry is None:
+            entry = self._locks[game_id] = _GameLock()
+            # Counted before evicting, the new lock must not be forgotten at once
+            entry.users += 1
+            self._evict()
+        else:
+            self._locks.move_to_end(game_id)
+            entry.users += 1
+        return entry
+
+    def _evict(self) -> None:
+        # Only forget locks no action is holding or waiting for
+        for game_id in list(self._locks):
+            if len(self._locks) <= self.max_locks:
+                break
+            if self._locks[game_id].users == 0:
+                del self._locks[game_id]
+
+    @asynccontextmanager
+    async def serialize(self, game_id: uuid.UUID, db: AsyncSession) -> AsyncIterator[None]:
+        """Run the actions of a game one at a time"""
+        entry = self._acquire_entry(game_id)
+        try:
+            async with entry.lock:
+                if self.mode == 'advisory':
+                    # Released when the action commits or rolls back
+                    await db.execute(
+                        text("SELECT pg_advisory_xact_lock(:key)"),
+                        {'key': advisory_key(game_id)}
+                    )
+                    # Another worker may have played on this game
+                    game_engine.evict(game_id)
+                yield
+        finally:
+            entry.users -= 1
+
+
+game_locks = GameLocks(max_locks=settings.GAME_LOCKS_MAX,
+                       mode=settings.GAME_LOCK_MODE)
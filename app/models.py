@@ -4,10 +4,16 @@ from datetime import datetime, timezone
 from typing import List
 
 from fastapi_users.db import SQLAlchemyBaseUserTableUUID
-from sqlalchemy import Column, ForeignKey, UniqueConstraint, Uuid, DateTime, Integer, String, Enum
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy import (
+    and_, BigInteger, Column, ForeignKey, Index, JSON, UniqueConstraint, Uuid, DateTime, Integer,
+    String, Enum,
+)
+from sqlalchemy.orm import DeclarativeBase, Mapped, foreign, mapped_column, relationship
 
-from app.enums import GameStatus, GameVariant, ParticipationStatus, CardSuit, CardRank, CardLocation
+from app.enums import (
+    GameStatus, GameVariant, ParticipationStatus, HandStatus, CardSuit, CardRank, CardLocation,
+)
+from app.shuffle import new_seed
 
 
 class Base(DeclarativeBase):
@@ -29,6 +35,11 @@ class User(SQLAlchemyBaseUserTableUUID, Base):
 class Game(Base):
     """Game table"""
     __tablename__ = "games"
+    __table_args__ = (
+        Index("ix_games_created_at_id", "created_at", "id"),
+        Index("ix_games_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_games_variant_created_at_id", "variant", "created_at", "id"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(
         primary_key=True, index=True, default=uuid.uuid4)
@@ -38,23 +49,39 @@ class Game(Base):
                     default=GameStatus.READY)
     hands_played = Column(Integer, nullable=False, default=0)
     bank = Column(Integer, nullable=False, default=1000)
+    shuffle_seed = Column(BigInteger, nullable=False, default=new_seed)
+    shuffles = Column(Integer, nullable=False, default=0)
     created_at = Column(DateTime(timezone=True), nullable=False,
                         default=lambda: datetime.now(timezone.utc))
     participations: Mapped[List["Participation"]
                            ] = relationship(back_populates="game")
     game_cards: Mapped[List["GameCard"]
                        ] = relationship(back_populates="game")
+    # Dealt first card first, as the shoe is drawn from its last position
+    dealer_cards: Mapped[List["GameCard"]] = relationship(
+        primaryjoin=lambda: and_(foreign(GameCard.holder_id) == Game.id,
+                                 GameCard.location_type == CardLocation.DEALER_HAND),
+        order_by=lambda: GameCard.position.desc(),
+        viewonly=True,
+    )
 
 
 class Participation(Base):
     """Participation table"""
     __tablename__ = "participations"
+    __table_args__ = (
+        Index("ix_participations_game_id_position", "game_id", "position"),
+        Index("ix_participations_user_id_created_at_id",
+              "user_id", "created_at", "id"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(
         primary_key=True, index=True, default=uuid.uuid4)
     position = Column(Integer, nullable=False, default=0)
     status = Column(Enum(ParticipationStatus), nullable=False,
                     default=ParticipationStatus.PLAYING)
+    hand_status = Column(Enum(HandStatus), nullable=False,
+                         default=HandStatus.WAITING)
     bet = Column(Integer, nullable=False, default=0)
     cash = Column(Integer, nullable=False, default=0)
     created_at = Column(DateTime(timezone=True), nullable=False,
@@ -65,6 +92,12 @@ class Participation(Base):
         "users.id", ondelete="SET NULL"))
     game: Mapped["Game"] = relationship(back_populates="participations")
     user: Mapped["User"] = relationship(back_populates="participations")
+    hand_cards: Mapped[List["GameCard"]] = relationship(
+        primaryjoin=lambda: and_(foreign(GameCard.holder_id) == Participation.id,
+                                 GameCard.location_type == CardLocation.PLAYER_HAND),
+        order_by=lambda: GameCard.position.desc(),
+        viewonly=True,
+    )
 
 
 class PhysicalCard(Base):
@@ -83,6 +116,11 @@ class PhysicalCard(Base):
 class GameCard(Base):
     """Game Card table"""
     __tablename__ = "game_cards"
+    __table_args__ = (
+        Index("ix_game_cards_game_id_position", "game_id", "position"),
+        Index("ix_game_cards_holder_id_location_type",
+              "holder_id", "location_type"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(
         primary_key=True, index=True, default=uuid.uuid4)
@@ -97,3 +135,20 @@ class GameCard(Base):
     position = Column(Integer, nullable=False, default=0)
     game: Mapped["Game"] = relationship(back_populates="game_cards")
     physical_card: Mapped["PhysicalCard"] = relationship()
+
+
+class IdempotencyKey(Base):
+    """Idempotency Key table, responses of the requests sent with the header"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        Index("ix_idempotency_keys_created_at", "created_at"),
+    )
+
+    user_id = Column(Uuid, ForeignKey(
+        "users.id", ondelete="CASCADE"), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False,
+                        default=lambda: datetime.now(timezone.utc))
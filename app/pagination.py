@@ -0,0 +1,49 @@
+"""Keyset pagination on (created_at, id)
+
+Pages are ordered newest first. The cursor of the next page is an opaque
+token encoding the (created_at, id) of the last row of the current page,
+so a page is read from an index whatever its depth, unlike an OFFSET.
+"""
+import base64
+import binascii
+import uuid
+from datetime import datetime
+from typing import Any, Optional, Sequence, TypeVar
+
+from sqlalchemy import Select, tuple_
+
+T = TypeVar("T")
+
+
+def encode_cursor(created_at: datetime, row_id: uuid.UUID) -> str:
+    """Encode the position of a row"""
+    return base64.urlsafe_b64encode(
+        f"{created_at.isoformat()}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    """Decode the position of a row, raising ValueError on invalid cursors"""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(
+            cursor.encode()).decode().split("|")
+    except (binascii.Error, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    return datetime.fromisoformat(created_at), uuid.UUID(row_id)
+
+
+def paginate(statement: Select, created_at: Any, row_id: Any,
+             cursor: Optional[str], limit: int) -> Select:
+    """Restrict a statement to the page after a cursor, plus one row telling
+    whether a next page exists"""
+    if cursor:
+        statement = statement.where(
+            tuple_(created_at, row_id) < tuple_(*decode_cursor(cursor)))
+    return statement.order_by(created_at.desc(), row_id.desc()).limit(limit + 1)
+
+
+def page(rows: Sequence[T], limit: int) -> tuple[list[T], Optional[str]]:
+    """Split the rows of a paginated statement into a page and the next cursor"""
+    items = list(rows[:limit])
+    if len(rows) <= limit:
+        return items, None
+    return items, encode_cursor(getattr(items[-1], 'created_at'), getattr(items[-1], 'id'))
@@ -1,6 +1,17 @@
 """Authentication routes"""
-from fastapi import APIRouter
-from app.auth import fastapi_users, auth_backend
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import Response
+
+from app.auth import (
+    UserManager,
+    bearer_transport,
+    fastapi_users,
+    auth_backend,
+    get_jwt_strategy,
+    get_refresh_strategy,
+    get_user_manager,
+)
+from app.schemas import TokenRead, TokenRefresh
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -8,3 +19,21 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 router.include_router(
     fastapi_users.get_auth_router(auth_backend), prefix=""
 )
+
+
+@router.post("/refresh", response_model=TokenRead)
+async def refresh(
+    token_refresh: TokenRefresh,
+    user_manager: UserManager = Depends(get_user_manager)
+) -> Response:
+    """Get new tokens from a refresh token, without the password"""
+    user = await get_refresh_strategy().read_token(
+        token_refresh.refresh_token, user_manager)
+
+    if not user or not user.is_active:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+    # The refresh token sent stays valid until it expires, see RefreshJWTStrategy
+    access_token = await get_jwt_strategy().write_token(user)
+    refresh_token = await get_refresh_strategy().write_token(user)
+    return bearer_transport.get_tokens_response(access_token, refresh_token)
@@ -1,12 +1,21 @@
 """Games routes"""
+import asyncio
 import uuid
-from fastapi import APIRouter, Depends, HTTPException
+from typing import AsyncIterable, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketException
+from fastapi.sse import EventSourceResponse, ServerSentEvent
+from starlette.status import WS_1008_POLICY_VIOLATION
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.auth import fastapi_users
-from app.schemas import GameCreate, GameRead
+from app.auth import UserManager, fastapi_users, get_jwt_strategy, get_user_manager
+from app.schemas import GameCreate, GamePage, GameRead
+from app.cache import game_cache
+from app.config import settings
 from app.database import get_db
+from app.enums import GameStatus, GameVariant
+from app.events import game_events
 from app.models import User, Game
+from app.pagination import page, paginate
 from app.blackjack import initialize_decks
 
 current_user = fastapi_users.current_user()
@@ -15,12 +24,36 @@ router = APIRouter(prefix="/games", tags=["games"])
 
 @router.get("")
 async def get_games(
+    status: Optional[GameStatus] = None,
+    variant: Optional[GameVariant] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=settings.PAGE_SIZE, ge=1, le=settings.PAGE_SIZE_MAX),
     _user: User = Depends(current_user),
     db: AsyncSession = Depends(get_db)
-) -> list[GameRead]:
-    """Get all games"""
-    games = await db.scalars(select(Game))
-    return [GameRead(**game.__dict__) for game in games]
+) -> GamePage:
+    """Get a page of games, newest first"""
+    generation = await game_cache.lobby_generation()
+    key = f"{status and status.value}:{variant and variant.value}:{limit}:{cursor}"
+    cached = await game_cache.get_page(generation, key)
+    if cached:
+        return cached
+
+    query = select(Game)
+    if status:
+        query = query.where(Game.status == status)
+    if variant:
+        query = query.where(Game.variant == variant)
+
+    try:
+        query = paginate(query, Game.created_at, Game.id, cursor, limit)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+
+    games, next_cursor = page((await db.scalars(query)).all(), limit)
+    game_page = GamePage(items=[GameRead(**game.__dict__) for game in games],
+                         next_cursor=next_cursor)
+    await game_cache.put_page(generation, key, game_page)
+    return game_page
 
 
 @router.get("/{game_id}")
@@ -30,12 +63,18 @@ async def get_game(
     db: AsyncSession = Depends(get_db)
 ) -> GameRead:
     """Get a game"""
+    cached = await game_cache.get_game(game_id)
+    if cached:
+        return cached
+
     game = await db.get(Game, game_id)
 
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
 
-    return GameRead(**game.__dict__)
+    game_read = GameRead(**game.__dict__)
+    await game_cache.put_game(game_read)
+    return game_read
 
 
 @router.post("")
@@ -52,5 +91,73 @@ async def create_game(
     await db.refresh(new_game)
 
     await initialize_decks(new_game, db)
+    await game_cache.invalidate(getattr(new_game, 'id'))
 
     return GameRead(**new_game.__dict__)
+
+
+async def followed_game(
+    game_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db)
+) -> uuid.UUID:
+    """Check that a followed game exists"""
+    game = await db.get(Game, game_id)
+
+    # The session lasts as long as the stream, give its connection back now
+    await db.close()
+
+    if not game:
+        raise HTTPException(status_code=404, detail="Game not found")
+
+    return game_id
+
+
+async def websocket_user(
+    token: str,
+    user_manager: UserManager = Depends(get_user_manager)
+) -> User:
+    """Authenticate a WebSocket by an access token in the query string,
+    browsers being unable to send an Authorization header"""
+    user = await get_jwt_strategy().read_token(token, user_manager)
+
+    if not user or not user.is_active:
+        raise WebSocketException(code=WS_1008_POLICY_VIOLATION,
+                                 reason="Invalid token")
+
+    return user
+
+
+# The user is authenticated before followed_game releases the connection
+@router.get("/{game_id}/events", response_class=EventSourceResponse)
+async def follow_game(
+    _user: User = Depends(current_user),
+    game_id: uuid.UUID = Depends(followed_game)
+) -> AsyncIterable[ServerSentEvent]:
+    """Stream the events of a game as Server-Sent Events"""
+    async with game_events.subscribe(game_id) as messages:
+        async for message in messages:
+            yield ServerSentEvent(raw_data=message)
+
+
+@router.websocket("/{game_id}/ws")
+async def follow_game_websocket(
+    websocket: WebSocket,
+    _user: User = Depends(websocket_user),
+    game_id: uuid.UUID = Depends(followed_game)
+):
+    """Stream the events of a game over a WebSocket"""
+    await websocket.accept()
+    async with game_events.subscribe(game_id) as messages:
+
+        async def forward() -> None:
+            async for message in messages:
+                await websocket.send_text(message)
+
+        forwarding = asyncio.create_task(forward())
+        try:
+            # Messages from the client are ignored, the loop ends on disconnect
+            async for _ in websocket.iter_text():
+                pass
+        finally:
+            forwarding.cancel()
+            await asyncio.gather(forwarding, return_exceptions=True)
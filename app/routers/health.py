@@ -1,6 +1,8 @@
 """System health checks"""
 from fastapi import APIRouter
 
+from app.database import get_pool_status
+
 router = APIRouter(tags=["system"])
 
 
@@ -8,3 +10,9 @@ router = APIRouter(tags=["system"])
 async def health_check():
     """Health check"""
     return {"status": "ok"}
+
+
+@router.get("/health/pool")
+async def pool_status():
+    """Database connection pool metrics"""
+    return get_pool_status()
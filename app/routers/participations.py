@@ -1,15 +1,36 @@
 """Participations routes"""
 import uuid
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from typing import Callable, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-
-from app.auth import fastapi_users
-from app.schemas import ParticipationCreate, ParticipationRead, ParticipationReadWithGameCards, ParticipationBet, GameCardRead
+from sqlalchemy.orm import joinedload
+
+from app.auth import fastapi_users, principal_cache
+from app.schemas import (
+    ParticipationCreate,
+    ParticipationRead,
+    ParticipationPage,
+    ParticipationReadWithGameCards,
+    ParticipationBet,
+)
+from app.config import settings
 from app.database import get_db
-from app.models import User, Game, Participation, GameCard
-from app.enums import GameStatus, ParticipationStatus, CardLocation
-from app.blackjack import evaluate_game_status, start_round
+from app.models import User, Game, Participation
+from app.enums import GameStatus, ParticipationStatus, HandStatus
+from app.blackjack import (
+    double,
+    evaluate_game_status,
+    hit,
+    max_seats,
+    stand,
+    update_game_status,
+)
+from app.engine import GameState, SeatState, game_engine
+from app.events import game_events
+from app.idempotency import IdempotentRequest, idempotent_request
+from app.locks import game_locks
+from app.pagination import page, paginate
 
 current_user = fastapi_users.current_user()
 router = APIRouter(prefix="/participations", tags=["participations"])
@@ -17,15 +38,29 @@ router = APIRouter(prefix="/participations", tags=["participations"])
 
 @router.get("")
 async def get_participations(
+    status: Optional[ParticipationStatus] = None,
+    game_id: Optional[uuid.UUID] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=settings.PAGE_SIZE, ge=1, le=settings.PAGE_SIZE_MAX),
     user: User = Depends(current_user),
     db: AsyncSession = Depends(get_db)
-) -> list[ParticipationRead]:
-    """Get all participations"""
-    participations = await db.scalars(
-        select(Participation).where(Participation.user_id == user.id)
-    )
+) -> ParticipationPage:
+    """Get a page of the participations of the user, newest first"""
+    query = select(Participation).where(Participation.user_id == user.id)
+    if status:
+        query = query.where(Participation.status == status)
+    if game_id:
+        query = query.where(Participation.game_id == game_id)
+
+    try:
+        query = paginate(query, Participation.created_at, Participation.id, cursor, limit)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
 
-    return [ParticipationRead(**participation.__dict__) for participation in participations]
+    participations, next_cursor = page((await db.scalars(query)).all(), limit)
+    return ParticipationPage(
+        items=[ParticipationRead(**participation.__dict__) for participation in participations],
+        next_cursor=next_cursor)
 
 
 @router.get("/{participation_id}")
@@ -33,73 +68,100 @@ async def get_participation(
     participation_id: uuid.UUID,
     user: User = Depends(current_user),
     db: AsyncSession = Depends(get_db)
-):
-    """Get a participation"""
+) -> ParticipationReadWithGameCards:
+    """Get a participation with its hand and the dealer up-card"""
     result = await db.execute(
         select(Participation)
         .where(Participation.id == participation_id)
+        .options(joinedload(Participation.hand_cards),
+                 joinedload(Participation.game).joinedload(Game.dealer_cards))
     )
-    participation = result.scalar_one_or_none()
+    participation = result.unique().scalar_one_or_none()
     if not participation:
         raise HTTPException(status_code=404, detail="Participation not found")
 
     if getattr(user, 'id') != getattr(participation, 'user_id'):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    result = await db.execute(
-        select(GameCard)
-        .where(GameCard.holder_id == participation.id)
-        .where(GameCard.location_type == CardLocation.PLAYER_HAND)
-    )
-    game_cards = result.scalars().all()
-
-    game_cards_data = [GameCardRead(**game_card.__dict__)
-                       for game_card in game_cards]
-    participation_data = {**participation.__dict__,
-                          'game_cards': game_cards_data}
-    return ParticipationReadWithGameCards(**participation_data)
+    # Only the first card of the dealer is dealt face up
+    dealer_cards = participation.game.dealer_cards if participation.game else []
+    return ParticipationReadWithGameCards.model_validate({
+        **participation.__dict__,
+        'game_cards': participation.hand_cards,
+        'dealer_up_card': dealer_cards[0] if dealer_cards else None,
+    }, from_attributes=True)
 
 
 @router.post("")
 async def create_participation(
     participation: ParticipationCreate,
     user: User = Depends(current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    idempotent: IdempotentRequest = Depends(idempotent_request)
 ) -> ParticipationRead:
     """Create a participation"""
-
-    game = await db.get(Game, participation.game_id)
-
-    if not game:
-        raise HTTPException(status_code=404, detail="Game not found")
-
-    if getattr(game, 'status') != GameStatus.READY:
-        raise HTTPException(
-            status_code=400, detail="Game is not accepting participants")
-
-    if getattr(user, 'cash') < participation.cash:
-        raise HTTPException(status_code=400, detail="Not enough cash")
-
-    participations = await db.scalars(
-        select(Participation).where(Participation.game_id == game.id))
-    participations_list = list(participations)
-    max_position = -1 if not participations_list else max((getattr(participation, 'position'))
-                                                          for participation in participations_list)
-
-    new_participation = Participation(
-        position=max_position + 1,
-        cash=participation.cash,
-        game_id=game.id,
-        user_id=user.id
-    )
-    db.add(new_participation)
-
-    user.cash = getattr(user, 'cash') - participation.cash
-
-    await db.commit()
-    await db.refresh(new_participation)
-
-    return ParticipationRead(**new_participation.__dict__)
+    async with game_locks.serialize(participation.game_id, db):
+        # Checked under the lock, a duplicate queued behind the first request replays it
+        replay = await idempotent.replay(user.id, db)
+        if replay:
+            return replay
+
+        game = await db.get(Game, participation.game_id)
+
+        if not game:
+            raise HTTPException(status_code=404, detail="Game not found")
+
+        if getattr(game, 'status') != GameStatus.READY:
+            raise HTTPException(
+                status_code=400, detail="Game is not accepting participants")
+
+        seats = await db.scalar(
+            select(func.count())
+            .select_from(Participation)
+            .where(Participation.game_id == game.id,
+                   Participation.status == ParticipationStatus.PLAYING))
+
+        if seats >= max_seats(getattr(game, 'variant')):
+            raise HTTPException(status_code=400, detail="Game is full")
+
+        # Debit the row only if it holds enough cash, concurrent buy-ins included
+        user_cash = await db.scalar(
+            update(User)
+            .where(User.id == user.id, User.cash >= participation.cash)
+            .values(cash=User.cash - participation.cash)
+            .returning(User.cash)
+            .execution_options(synchronize_session=False)
+        )
+
+        if user_cash is None:
+            await db.rollback()
+            raise HTTPException(status_code=400, detail="Not enough cash")
+
+        max_position = await db.scalar(
+            select(func.max(Participation.position))
+            .where(Participation.game_id == game.id))
+
+        new_participation = Participation(
+            position=0 if max_position is None else max_position + 1,
+            cash=participation.cash,
+            game_id=game.id,
+            user_id=user.id
+        )
+        db.add(new_participation)
+        await db.flush()
+
+        # The defaults are generated client-side, no need to read the row back
+        participation_read = ParticipationRead(**new_participation.__dict__)
+        idempotent.save(participation_read, db)
+        await db.commit()
+        game_engine.add_seat(new_participation)
+        principal_cache.invalidate(user.id)
+        await game_events.publish(game.id, "participant_joined", {
+            'participation_id': new_participation.id,
+            'position': new_participation.position,
+        })
+
+    return participation_read
 
 
 @router.delete("/{participation_id}", status_code=204)
@@ -110,28 +172,44 @@ async def delete_participation(
 ):
     """Quit a game"""
 
-    participation = await db.get(Participation, participation_id)
+    game_id = await game_engine.locate(participation_id, db)
 
-    if not participation:
+    if not game_id:
         raise HTTPException(status_code=404, detail="Participation not found")
 
-    if getattr(user, 'id') != getattr(participation, 'user_id'):
-        raise HTTPException(status_code=401, detail="Unauthorized")
+    async with game_locks.serialize(game_id, db):
+        state = await game_engine.load(game_id, db)
 
-    game = await db.get(Game, participation.game_id)
+        if not state:
+            raise HTTPException(
+                status_code=404, detail="Game not found for this participation")
 
-    if not game:
-        raise HTTPException(
-            status_code=404, detail="Game not found for this participation")
+        seat = state.seats.get(participation_id)
 
-    if getattr(game, 'status') != GameStatus.READY:
-        raise HTTPException(
-            status_code=400, detail="Game is on going")
+        if not seat:
+            raise HTTPException(status_code=404, detail="Participation not found")
 
-    setattr(participation, 'status', ParticipationStatus.QUIT)
-    setattr(game, 'status', evaluate_game_status(game, db))
+        if getattr(user, 'id') != seat.user_id:
+            raise HTTPException(status_code=401, detail="Unauthorized")
 
-    await db.commit()
+        if state.status != GameStatus.READY:
+            raise HTTPException(
+                status_code=400, detail="Game is on going")
+
+        try:
+            state.set_seat(seat, status=ParticipationStatus.QUIT)
+            cash = state.cash_out(seat)
+            # Quitting may leave every remaining seat with a bet, starting the round
+            state.emit("participant_left", participation_id=seat.id, position=seat.position,
+                       cash=cash, status=evaluate_game_status(state))
+            update_game_status(state)
+
+            await game_engine.flush(state, db)
+        except Exception:
+            # A failed deal leaves changes behind, reload the game next time
+            game_engine.evict(state.id)
+            raise
+        principal_cache.invalidate(seat.user_id)
 
     return None
 
@@ -141,39 +219,135 @@ async def bet(
     participation_id: uuid.UUID,
     participation_bet: ParticipationBet,
     user: User = Depends(current_user),
-    db: AsyncSession = Depends(get_db)
-):
+    db: AsyncSession = Depends(get_db),
+    idempotent: IdempotentRequest = Depends(idempotent_request)
+) -> ParticipationRead:
     """Bet on a game"""
+    game_id = await game_engine.locate(participation_id, db)
+
+    if not game_id:
+        raise HTTPException(status_code=404, detail="Participation not found")
 
-    participation = await db.get(Participation, participation_id)
+    async with game_locks.serialize(game_id, db):
+        # Checked under the lock, a duplicate queued behind the first request replays it
+        replay = await idempotent.replay(user.id, db)
+        if replay:
+            return replay
 
-    if not participation:
+        state = await game_engine.load(game_id, db)
+
+        if not state:
+            raise HTTPException(
+                status_code=404, detail="Game not found for this participation")
+
+        seat = state.seats.get(participation_id)
+
+        if not seat:
+            raise HTTPException(status_code=404, detail="Participation not found")
+
+        if getattr(user, 'id') != seat.user_id:
+            raise HTTPException(status_code=401, detail="Unauthorized")
+
+        if seat.status != ParticipationStatus.PLAYING:
+            raise HTTPException(
+                status_code=400, detail="Participation is terminated")
+
+        if state.status != GameStatus.READY:
+            raise HTTPException(
+                status_code=400, detail="Game is not accepting bets")
+
+        # A lost hand costs the whole bet, it must be covered by the seat
+        if participation_bet.bet > seat.cash:
+            raise HTTPException(
+                status_code=400, detail="Not enough cash to cover the bet")
+
+        try:
+            state.set_seat(seat, bet=participation_bet.bet)
+            state.emit("bet_placed", participation_id=seat.id,
+                       position=seat.position, bet=seat.bet)
+
+            update_game_status(state)
+
+            participation_read = ParticipationRead(**seat.to_dict())
+            idempotent.save(participation_read, db)
+            await game_engine.flush(state, db)
+        except Exception:
+            # A failed deal leaves changes behind, reload the game next time
+            game_engine.evict(state.id)
+            raise
+
+    return participation_read
+
+
+async def play(
+    participation_id: uuid.UUID,
+    user: User,
+    db: AsyncSession,
+    action: Callable[[GameState, SeatState], None]
+) -> ParticipationRead:
+    """Play an action on the hand of a participation"""
+
+    game_id = await game_engine.locate(participation_id, db)
+
+    if not game_id:
         raise HTTPException(status_code=404, detail="Participation not found")
 
-    if getattr(user, 'id') != getattr(participation, 'user_id'):
-        raise HTTPException(status_code=401, detail="Unauthorized")
+    async with game_locks.serialize(game_id, db):
+        state = await game_engine.load(game_id, db)
+
+        if not state:
+            raise HTTPException(
+                status_code=404, detail="Game not found for this participation")
+
+        seat = state.seats.get(participation_id)
 
-    if getattr(participation, 'status') != ParticipationStatus.PLAYING:
-        raise HTTPException(
-            status_code=400, detail="Participation is terminated")
+        if not seat:
+            raise HTTPException(status_code=404, detail="Participation not found")
 
-    game = await db.get(Game, participation.game_id)
+        if getattr(user, 'id') != seat.user_id:
+            raise HTTPException(status_code=401, detail="Unauthorized")
 
-    if not game:
-        raise HTTPException(
-            status_code=404, detail="Game not found for this participation")
+        if state.status != GameStatus.PLAYING or seat.hand_status != HandStatus.PLAYING:
+            raise HTTPException(
+                status_code=400, detail="Hand is not being played")
 
-    if getattr(game, 'status') != GameStatus.READY:
-        raise HTTPException(
-            status_code=400, detail="Game is not accepting bets")
+        try:
+            action(state, seat)
+        except ValueError as exc:
+            # A refused action may have left changes behind, reload the game next time
+            game_engine.evict(state.id)
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    setattr(participation, 'bet', participation_bet.bet)
+        await game_engine.flush(state, db)
 
-    previous_status = getattr(game, 'status')
-    setattr(game, 'status', await evaluate_game_status(game, db))
+    return ParticipationRead(**seat.to_dict())
 
-    if previous_status == GameStatus.READY and getattr(game, 'status') == GameStatus.PLAYING:
-        await start_round(game, db)
-        await db.refresh(participation)
 
-    return ParticipationRead(**participation.__dict__)
+@router.post("/{participation_id}/hit")
+async def hit_hand(
+    participation_id: uuid.UUID,
+    user: User = Depends(current_user),
+    db: AsyncSession = Depends(get_db)
+) -> ParticipationRead:
+    """Draw a card"""
+    return await play(participation_id, user, db, hit)
+
+
+@router.post("/{participation_id}/stand")
+async def stand_hand(
+    participation_id: uuid.UUID,
+    user: User = Depends(current_user),
+    db: AsyncSession = Depends(get_db)
+) -> ParticipationRead:
+    """Stand on the hand"""
+    return await play(participation_id, user, db, stand)
+
+
+@router.post("/{participation_id}/double")
+async def double_hand(
+    participation_id: uuid.UUID,
+    user: User = Depends(current_user),
+    db: AsyncSession = Depends(get_db)
+) -> ParticipationRead:
+    """Double the bet and draw a last card"""
+    return await play(participation_id, user, db, double)
@@ -0,0 +1,36 @@
+"""Simulations routes"""
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.auth import fastapi_users
+from app.schemas import SimulationCreate, SimulationRead
+from app.models import User
+from app.simulation import simulation_pool
+from app.config import settings
+
+current_superuser = fastapi_users.current_user(active=True, superuser=True)
+router = APIRouter(prefix="/simulations", tags=["simulations"])
+
+
+@router.post("")
+async def create_simulation(
+    simulation: SimulationCreate,
+    _user: User = Depends(current_superuser)
+) -> SimulationRead:
+    """Simulate rounds of a variant to price its house edge"""
+
+    if simulation.rounds > settings.SIMULATION_MAX_ROUNDS:
+        raise HTTPException(
+            status_code=400, detail="Too many rounds to simulate")
+
+    # Every core is used by a simulation, another one would only compete with it
+    if simulation_pool.busy:
+        raise HTTPException(
+            status_code=409, detail="A simulation is already running")
+
+    result = await simulation_pool.run(
+        simulation.variant,
+        simulation.rounds,
+        simulation.player_stands_on,
+    )
+
+    return SimulationRead(**result._asdict())
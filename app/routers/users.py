@@ -1,9 +1,11 @@
 """Users routes"""
 from fastapi import APIRouter, Depends
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.auth import fastapi_users
+from app.auth import fastapi_users, principal_cache
 from app.schemas import UserCreate, UserRead, UserCharge
 from app.database import User, get_db
+from app.idempotency import IdempotentRequest, idempotent_request
 from app.logger import logger
 
 current_user = fastapi_users.current_user()
@@ -27,14 +29,27 @@ async def get_user(
 async def charge_user(
     charge: UserCharge,
     user: User = Depends(current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    idempotent: IdempotentRequest = Depends(idempotent_request)
 ) -> UserRead:
     """Add cash to user account"""
+    replay = await idempotent.replay(user.id, db)
+    if replay:
+        return replay
 
     logger.info("User %s is charging %s cash", user.id, charge.amount)
-    user.cash = getattr(user, 'cash') + charge.amount
+    # Increment the row itself, concurrent charges must all be counted
+    user = await db.scalar(
+        update(User)
+        .where(User.id == user.id)
+        .values(cash=User.cash + charge.amount)
+        .returning(User)
+        .execution_options(populate_existing=True)
+    )
+    user_read = UserRead(**user.__dict__)
+    idempotent.save(user_read, db)
     await db.commit()
-    await db.refresh(user)
+    principal_cache.invalidate(user.id)
     logger.info("User %s has %s cash", user.id, user.cash)
 
-    return UserRead(**user.__dict__)
+    return user_read
@@ -1,13 +1,15 @@
 """API schemas"""
 import uuid
 
-from typing import List
+from typing import List, Optional
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from pydantic.types import PositiveInt
 from fastapi_users import schemas
 
-from app.enums import GameVariant, GameStatus, ParticipationStatus, CardSuit, CardRank, CardLocation
+from app.enums import (
+    GameVariant, GameStatus, ParticipationStatus, HandStatus, CardSuit, CardRank, CardLocation,
+)
 
 
 class UserRead(schemas.BaseUser[uuid.UUID]):
@@ -27,6 +29,16 @@ class UserCharge(BaseModel):
     amount: PositiveInt
 
 
+class TokenRead(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str
+
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+
 class GameRead(BaseModel):
     id: uuid.UUID
     variant: GameVariant
@@ -37,6 +49,11 @@ class GameRead(BaseModel):
     created_at: datetime
 
 
+class GamePage(BaseModel):
+    items: List[GameRead]
+    next_cursor: Optional[str]
+
+
 class GameCreate(BaseModel):
     variant: GameVariant
 
@@ -53,6 +70,7 @@ class ParticipationRead(BaseModel):
     id: uuid.UUID
     position: int
     status: ParticipationStatus
+    hand_status: HandStatus
     bet: int
     cash: int
     created_at: datetime
@@ -60,14 +78,37 @@ class ParticipationRead(BaseModel):
     user_id: uuid.UUID
 
 
+class ParticipationPage(BaseModel):
+    items: List[ParticipationRead]
+    next_cursor: Optional[str]
+
+
 class ParticipationReadWithGameCards(ParticipationRead):
     game_cards: List[GameCardRead]
+    dealer_up_card: Optional[GameCardRead]
 
 
 class ParticipationCreate(BaseModel):
-    cash: int
+    cash: PositiveInt
     game_id: uuid.UUID
 
 
 class ParticipationBet(BaseModel):
-    bet: int
+    bet: PositiveInt
+
+
+class SimulationCreate(BaseModel):
+    variant: GameVariant
+    rounds: PositiveInt
+    player_stands_on: int = Field(default=17, ge=12, le=21)
+
+
+class SimulationRead(BaseModel):
+    variant: GameVariant
+    rounds: int
+    ev: float
+    variance: float
+    std_error: float
+    house_edge: float
+    seconds: float
+    rounds_per_second: float
@@ -0,0 +1,50 @@
+"""Shoe templates built from the physical cards"""
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import PhysicalCard
+from app.enums import GameVariant, CardSuit, CardRank
+from app.cards import CARDS_PER_DECK
+from app.logger import logger
+
+DECK_COUNTS: dict[GameVariant, int] = {
+    GameVariant.ONE_DECK: 1,
+    GameVariant.TWO_DECKS: 2,
+}
+
+ShoeTemplate = tuple[tuple[uuid.UUID, CardSuit, CardRank], ...]
+
+_shoe_templates: dict[GameVariant, ShoeTemplate] = {}
+
+
+async def load_shoe_templates(db: AsyncSession) -> None:
+    """Load the physical cards once and build the shoe of every variant"""
+    physical_cards = list(await db.execute(
+        select(PhysicalCard.id, PhysicalCard.suit,
+               PhysicalCard.rank, PhysicalCard.deck_number)
+        .order_by(PhysicalCard.deck_number)
+    ))
+
+    for variant, deck_count in DECK_COUNTS.items():
+        template = tuple(
+            (physical_card_id, suit, rank)
+            for physical_card_id, suit, rank, deck_number in physical_cards
+            if deck_number <= deck_count
+        )
+        if len(template) != deck_count * CARDS_PER_DECK:
+            raise ValueError(
+                f"Variant {variant.name} needs {deck_count} physical decks, "
+                f"found {len(template)} cards")
+        _shoe_templates[variant] = template
+
+    logger.info("Loaded shoe templates for %s variants", len(_shoe_templates))
+
+
+async def get_shoe_template(variant: GameVariant, db: AsyncSession) -> ShoeTemplate:
+    """Get the cards making the shoe of a variant"""
+    if variant not in _shoe_templates:
+        await load_shoe_templates(db)
+
+    return _shoe_templates[variant]
@@ -0,0 +1,30 @@
+"""Seeded shuffles of the game shoes
+
+Every game draws a secret seed from `secrets` when it is created. Its
+shoe is shuffled once at creation (shuffle number 0) and again at every
+reshuffle (shuffle numbers 1, 2, ...), each time with a generator seeded
+from the game seed and the shuffle number, over the cards sorted by code
+and id. Any shoe of a game can therefore be replayed from its seed and
+its game_cards rows.
+"""
+import random
+import secrets
+import uuid
+
+
+def new_seed() -> int:
+    """Draw a seed for a new game, fitting a signed 64 bits column"""
+    return secrets.randbits(63)
+
+
+def shuffle_rng(seed: int, shuffle_number: int) -> random.Random:
+    """Generator of a shuffle of a game"""
+    return random.Random(f"{seed}:{shuffle_number}")
+
+
+def shuffle_shoe(cards: list[uuid.UUID], codes: dict[uuid.UUID, int],
+                 seed: int, shuffle_number: int) -> list[uuid.UUID]:
+    """Shuffle cards in the reproducible order of a game shuffle"""
+    shoe = sorted(cards, key=lambda card_id: (codes[card_id], card_id))
+    shuffle_rng(seed, shuffle_number).shuffle(shoe)
+    return shoe
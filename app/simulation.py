@@ -0,0 +1,229 @@
+"""Monte Carlo simulation of blackjack rounds
+
+Plays rounds of one hand against the dealer with the rules of the API
+(naturals paid 3 to 2, dealer standing on DEALER_STANDS_ON) without any
+database. Rounds are dealt from freshly shuffled shoes in NumPy batches
+and split in chunks played by a process pool.
+
+    python -m app.simulation --variant two_decks --rounds 10000000
+"""
+import argparse
+import asyncio
+import math
+import multiprocessing
+import os
+import secrets
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from app.blackjack import DEALER_STANDS_ON, NATURAL_PAYOUT
+from app.cards import CARD_IS_ACE, CARD_VALUES, CARDS_PER_DECK
+from app.config import settings
+from app.enums import GameVariant
+from app.shoe import DECK_COUNTS
+
+# Rounds dealt at once by a worker
+BATCH_SIZE = 50_000
+
+_VALUES = np.array(CARD_VALUES, dtype=np.int16)
+_IS_ACE = np.array(CARD_IS_ACE, dtype=bool)
+
+
+class SimulationResult(NamedTuple):
+    """Outcome of a simulation, amounts are per unit bet"""
+    variant: GameVariant
+    rounds: int
+    ev: float
+    variance: float
+    std_error: float
+    house_edge: float
+    seconds: float
+    rounds_per_second: float
+
+
+def _best_totals(hard: np.ndarray, has_ace: np.ndarray) -> np.ndarray:
+    """Best totals of hands, counting one ace as 11 when it does not bust"""
+    return np.where(has_ace & (hard <= 11), hard + 10, hard)
+
+
+def _draw_until(shoes: np.ndarray, cursors: np.ndarray, hard: np.ndarray,
+                has_ace: np.ndarray, active: np.ndarray, stands_on: int) -> np.ndarray:
+    """Draw cards for the active hands until they reach a total"""
+    rows = np.arange(len(shoes))
+    totals = _best_totals(hard, has_ace)
+    active = active & (totals < stands_on)
+    while active.any():
+        cards = shoes[rows[active], cursors[active]]
+        hard[active] += _VALUES[cards]
+        has_ace[active] |= _IS_ACE[cards]
+        cursors[active] += 1
+        totals = _best_totals(hard, has_ace)
+        active &= totals < stands_on
+    return totals
+
+
+def play_rounds(shoes: np.ndarray, player_stands_on: int) -> np.ndarray:
+    """Play one round per shoe and return the player results per unit bet"""
+    first, second = shoes[:, 0], shoes[:, 1]
+    player_hard = _VALUES[first] + _VALUES[second]
+    player_ace = _IS_ACE[first] | _IS_ACE[second]
+    first, second = shoes[:, 2], shoes[:, 3]
+    dealer_hard = _VALUES[first] + _VALUES[second]
+    dealer_ace = _IS_ACE[first] | _IS_ACE[second]
+    cursors = np.full(len(shoes), 4)
+
+    player_natural = _best_totals(player_hard, player_ace) == 21
+    dealer_natural = _best_totals(dealer_hard, dealer_ace) == 21
+    playing = ~player_natural & ~dealer_natural
+
+    player_totals = _draw_until(shoes, cursors, player_hard, player_ace,
+                                playing, player_stands_on)
+    player_busted = player_totals > 21
+    dealer_totals = _draw_until(shoes, cursors, dealer_hard, dealer_ace,
+                                playing & ~player_busted, DEALER_STANDS_ON)
+
+    # Same precedence as blackjack.payout
+    return np.select(
+        [
+            player_busted,
+            player_natural & dealer_natural,
+            player_natural,
+            dealer_natural,
+            dealer_totals > 21,
+            player_totals > dealer_totals,
+            player_totals < dealer_totals,
+        ],
+        [-1.0, 0.0, NATURAL_PAYOUT[0] / NATURAL_PAYOUT[1], -1.0, 1.0, 1.0, -1.0],
+        default=0.0,
+    )
+
+
+def permutations(seed: int, size: int, count: int) -> np.ndarray:
+    """Generate a batch of reproducible permutations of range(size), one per row"""
+    rng = np.random.default_rng(seed)
+    return rng.permuted(np.tile(np.arange(size, dtype=np.int16), (count, 1)), axis=1)
+
+
+def simulate_chunk(variant: GameVariant, rounds: int, player_stands_on: int,
+                   seed: int) -> tuple[int, float, float]:
+    """Play rounds and return their count, sum and sum of squares"""
+    template = np.tile(np.arange(CARDS_PER_DECK, dtype=np.int16),
+                       DECK_COUNTS[variant])
+    rng = np.random.default_rng(seed)
+
+    total = total_squares = 0.0
+    played = 0
+    while played < rounds:
+        count = min(BATCH_SIZE, rounds - played)
+        batch_seed = int(rng.integers(2 ** 63))
+        shoes = template[permutations(batch_seed, len(template), count)]
+        results = play_rounds(shoes, player_stands_on)
+        total += float(results.sum())
+        total_squares += float(np.square(results).sum())
+        played += count
+
+    return played, total, total_squares
+
+
+def create_pool(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """Process pool of the simulations, its workers spawned rather than
+    forked from a process holding threads and sockets"""
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                               mp_context=multiprocessing.get_context("spawn"))
+
+
+def simulate(variant: GameVariant, rounds: int, player_stands_on: int = DEALER_STANDS_ON,
+             workers: Optional[int] = None, chunk_size: int = 500_000,
+             seed: Optional[int] = None,
+             executor: Optional[Executor] = None) -> SimulationResult:
+    """Simulate rounds of a variant across a process pool, a new one unless given"""
+    chunks = [min(chunk_size, rounds - start)
+              for start in range(0, rounds, chunk_size)]
+    seeds = np.random.SeedSequence(
+        seed if seed is not None else secrets.randbits(128)).generate_state(len(chunks), np.uint64)
+
+    start = time.perf_counter()
+    pool = executor or create_pool(workers)
+    try:
+        outcomes = list(pool.map(
+            simulate_chunk,
+            [variant] * len(chunks),
+            chunks,
+            [player_stands_on] * len(chunks),
+            [int(chunk_seed) for chunk_seed in seeds],
+        ))
+    finally:
+        if executor is None:
+            pool.shutdown()
+    seconds = time.perf_counter() - start
+
+    played = sum(count for count, _, _ in outcomes)
+    ev = sum(total for _, total, _ in outcomes) / played
+    variance = sum(squares for _, _, squares in outcomes) / played - ev ** 2
+
+    return SimulationResult(
+        variant=variant,
+        rounds=played,
+        ev=ev,
+        variance=variance,
+        std_error=math.sqrt(variance / played),
+        house_edge=-ev,
+        seconds=seconds,
+        rounds_per_second=played / seconds,
+    )
+
+
+class SimulationPool:
+    """Process pool shared by the simulations of the API, playing one at a time"""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._running = asyncio.Lock()
+
+    @property
+    def busy(self) -> bool:
+        """Whether a simulation is being played"""
+        return self._running.locked()
+
+    async def run(self, variant: GameVariant, rounds: int,
+                  player_stands_on: int) -> SimulationResult:
+        """Simulate rounds on the pool, after the simulation being played"""
+        async with self._running:
+            if self._executor is None:
+                self._executor = create_pool(self.workers)
+            # The pool blocks until every chunk is played
+            return await asyncio.to_thread(simulate, variant, rounds, player_stands_on,
+                                           executor=self._executor)
+
+    def shutdown(self) -> None:
+        """Stop the workers of the pool"""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+simulation_pool = SimulationPool(workers=settings.SIMULATION_WORKERS or None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate blackjack rounds")
+    parser.add_argument("--variant", choices=[variant.value for variant in GameVariant],
+                        help="variant to simulate, all of them by default")
+    parser.add_argument("--rounds", type=int, default=1_000_000)
+    parser.add_argument("--player-stands-on", type=int, default=DEALER_STANDS_ON,
+                        help="total from which the player stops drawing")
+    parser.add_argument("--workers", type=int, help="processes, one per core by default")
+    parser.add_argument("--seed", type=int, help="seed to reproduce a simulation")
+    args = parser.parse_args()
+
+    variants = [GameVariant(args.variant)] if args.variant else list(GameVariant)
+    for simulated_variant in variants:
+        result = simulate(simulated_variant, args.rounds, args.player_stands_on,
+                          workers=args.workers, seed=args.seed)
+        print(f"{result.variant.value}: EV {result.ev:+.5f} ± {result.std_error:.5f}, "
+              f"variance {result.variance:.4f}, "
+              f"{result.rounds_per_second:,.0f} rounds/s over {result.rounds:,} rounds")
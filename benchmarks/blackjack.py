@@ -0,0 +1,87 @@
+"""Micro-benchmarks of deck creation, shuffling and dealing
+
+Times initialize_decks against the database, and shuffle_deck and
+deal_initial_hands on the cached game state followed by the flush of
+their changes.
+
+    DB_URL=sqlite+aiosqlite:///bench.db python -m benchmarks.blackjack --games 200
+"""
+import argparse
+import asyncio
+import uuid
+
+from app.blackjack import deal_initial_hands, initialize_decks, shuffle_deck
+from app.database import AsyncSessionLocal
+from app.engine import game_engine
+from app.enums import GameStatus, GameVariant
+from app.models import Game, Participation
+from benchmarks.common import Timings, prepare_database
+
+
+async def bench_initialize_decks(timings: Timings, games: int,
+                                 variant: GameVariant) -> list[uuid.UUID]:
+    """Create games and time the creation of their shoes"""
+    game_ids = []
+    async with AsyncSessionLocal() as db:
+        for _ in range(games):
+            game = Game(variant=variant)
+            db.add(game)
+            await db.commit()
+            await db.refresh(game)
+
+            with timings.measure(f"initialize_decks ({variant.value})"):
+                await initialize_decks(game, db)
+            game_ids.append(game.id)
+    return game_ids
+
+
+async def bench_round(timings: Timings, game_id: uuid.UUID, seats: int) -> None:
+    """Seat players at a game, then time a reshuffle and the initial deal"""
+    async with AsyncSessionLocal() as db:
+        participations = [
+            Participation(position=i, cash=500, game_id=game_id)
+            for i in range(seats)
+        ]
+        db.add_all(participations)
+        await db.commit()
+        for participation in participations:
+            await db.refresh(participation)
+            game_engine.add_seat(participation)
+
+        state = await game_engine.load(game_id, db)
+
+        with timings.measure("shuffle_deck"):
+            shuffle_deck(state)
+        with timings.measure("shuffle_deck flush"):
+            await game_engine.flush(state, db)
+
+        for seat in state.seats.values():
+            state.set_seat(seat, bet=10)
+        state.set_game(status=GameStatus.PLAYING)
+
+        with timings.measure(f"deal_initial_hands ({seats} seats)"):
+            deal_initial_hands(state)
+        with timings.measure("deal_initial_hands flush"):
+            await game_engine.flush(state, db)
+
+
+async def main(games: int, seats: int, variant: GameVariant) -> None:
+    """Run the micro-benchmarks and print the report"""
+    await prepare_database()
+    timings = Timings()
+
+    game_ids = await bench_initialize_decks(timings, games, variant)
+    for game_id in game_ids:
+        await bench_round(timings, game_id, seats)
+
+    print(timings.report())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--seats", type=int, default=5)
+    parser.add_argument("--variant", choices=[variant.value for variant in GameVariant],
+                        default=GameVariant.TWO_DECKS.value)
+    args = parser.parse_args()
+    asyncio.run(main(args.games, args.seats, GameVariant(args.variant)))
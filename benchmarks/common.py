@@ -0,0 +1,66 @@
+"""Shared helpers of the benchmarks"""
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy import func, select
+
+from app.database import AsyncSessionLocal, init_engine
+from app.models import Base, PhysicalCard
+from app.enums import CardRank, CardSuit
+
+
+class Timings:
+    """Latencies of named operations, in milliseconds"""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        """Time the enclosed block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(name, []).append(
+                (time.perf_counter() - start) * 1000)
+
+    def report(self, seconds: float = 0.0) -> str:
+        """Count, throughput and percentiles of every operation"""
+        lines = [f"{'operation':<40} {'count':>7} {'ops/s':>9} "
+                 f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"]
+        for name, samples in self.samples.items():
+            if len(samples) > 1:
+                percentiles = statistics.quantiles(samples, n=100)
+            else:
+                percentiles = samples * 99
+            throughput = len(samples) / seconds if seconds else 1000 / statistics.mean(samples)
+            lines.append(
+                f"{name:<40} {len(samples):>7} {throughput:>9.1f} "
+                f"{percentiles[49]:>9.3f} {percentiles[94]:>9.3f} {percentiles[98]:>9.3f}")
+        return "\n".join(lines)
+
+
+async def prepare_database() -> None:
+    """Create and seed the schema on a SQLite stand-in, Postgres must be migrated"""
+    engine = init_engine()
+    if engine.dialect.name != 'sqlite':
+        return
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with AsyncSessionLocal() as db:
+        if await db.scalar(select(func.count()).select_from(PhysicalCard)):
+            return
+        # Same physical decks as migration c7a4193d1df5
+        db.add_all([
+            PhysicalCard(id=uuid.uuid4(), suit=suit, rank=rank, deck_number=dn)
+            for dn in range(1, 3)
+            for suit in CardSuit
+            for rank in CardRank
+        ])
+        await db.commit()
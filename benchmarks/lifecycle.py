@@ -0,0 +1,112 @@
+"""Throughput and latency of the game lifecycle through the API
+
+Plays register, login, charge, create game, join, bet (the last bet
+deals the round) and a participation poll for a number of tables,
+in-process through an ASGI client, and reports the throughput and
+p50/p95/p99 latency of every endpoint.
+
+Against a migrated local Postgres, or a SQLite stand-in created on the fly:
+
+    DB_URL=sqlite+aiosqlite:///bench.db python -m benchmarks.lifecycle --tables 50
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+
+from app.app import app
+from app.enums import GameVariant
+from benchmarks.common import Timings, prepare_database
+
+
+async def play_table(client: httpx.AsyncClient, timings: Timings,
+                     seats: int, variant: GameVariant) -> None:
+    """Seat players at a new table and play its first round"""
+    headers = []
+    for _ in range(seats):
+        email, password = f"bench-{uuid.uuid4()}@example.com", "bench-password"
+        with timings.measure("POST /users/register"):
+            response = await client.post(
+                "/users/register", json={"email": email, "password": password})
+        response.raise_for_status()
+
+        with timings.measure("POST /auth/login"):
+            response = await client.post(
+                "/auth/login", data={"username": email, "password": password})
+        response.raise_for_status()
+        headers.append(
+            {"Authorization": f"Bearer {response.json()['access_token']}"})
+
+        with timings.measure("POST /users/charge"):
+            response = await client.post(
+                "/users/charge", json={"amount": 1000}, headers=headers[-1])
+        response.raise_for_status()
+
+    with timings.measure("POST /games"):
+        response = await client.post(
+            "/games", json={"variant": variant.value}, headers=headers[0])
+    response.raise_for_status()
+    game_id = response.json()["id"]
+
+    participation_ids = []
+    for seat_headers in headers:
+        with timings.measure("POST /participations"):
+            response = await client.post(
+                "/participations", json={"cash": 500, "game_id": game_id},
+                headers=seat_headers)
+        response.raise_for_status()
+        participation_ids.append(response.json()["id"])
+
+    for participation_id, seat_headers in zip(participation_ids, headers):
+        with timings.measure("POST /participations/{id}/bet"):
+            response = await client.post(
+                f"/participations/{participation_id}/bet", json={"bet": 10},
+                headers=seat_headers)
+        response.raise_for_status()
+
+    for participation_id, seat_headers in zip(participation_ids, headers):
+        with timings.measure("GET /participations/{id}"):
+            response = await client.get(
+                f"/participations/{participation_id}", headers=seat_headers)
+        response.raise_for_status()
+
+    with timings.measure("GET /games/{id}"):
+        response = await client.get(f"/games/{game_id}", headers=headers[0])
+    response.raise_for_status()
+
+
+async def main(tables: int, seats: int, concurrency: int, variant: GameVariant) -> None:
+    """Play the tables and print the report"""
+    await prepare_database()
+    timings = Timings()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited_table(client: httpx.AsyncClient) -> None:
+        async with semaphore:
+            await play_table(client, timings, seats, variant)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(limited_table(client) for _ in range(tables)))
+            seconds = time.perf_counter() - start
+
+    requests = sum(len(samples) for samples in timings.samples.values())
+    print(f"{tables} tables of {seats} seats, {requests} requests in {seconds:.2f} s "
+          f"({requests / seconds:.1f} requests/s)\n")
+    print(timings.report(seconds))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tables", type=int, default=20)
+    parser.add_argument("--seats", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=10,
+                        help="tables played at the same time")
+    parser.add_argument("--variant", choices=[variant.value for variant in GameVariant],
+                        default=GameVariant.ONE_DECK.value)
+    args = parser.parse_args()
+    asyncio.run(main(args.tables, args.seats, args.concurrency, GameVariant(args.variant)))
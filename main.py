@@ -1,5 +1,11 @@
 """Main entry point for the FastAPI application."""
+import asyncio
+
 import uvicorn
 
+from app.database import provision_database
+
 if __name__ == "__main__":
+    # Provision once here, workers only connect
+    asyncio.run(provision_database())
     uvicorn.run("app.app:app", host="0.0.0.0", log_level="info", reload=True)